@@ -14,8 +14,16 @@ app.config['MONGODB_USERNAME'] = os.environ.get('MONGODB_USERNAME')
 app.config['MONGODB_PASSWORD'] = os.environ.get('MONGODB_PASSWORD')
 app.config['MONGO_URI'] = os.environ.get('MONGO_URI')
 
+# the bio month stage plans in turn by default, a pool is started for every plan (see update_bio_month_production)
+app.config['BIO_MONTH_WORKERS'] = int(os.environ.get('BIO_MONTH_WORKERS', 1))
+app.config['PLAN_JOB_WORKERS'] = int(os.environ.get('PLAN_JOB_WORKERS', 2))
+app.config['BATCH_WORKERS'] = int(os.environ['BATCH_WORKERS']) if os.environ.get('BATCH_WORKERS') else None
+app.config['REFERENCE_DATA_TTL_SECONDS'] = float(os.environ.get('REFERENCE_DATA_TTL_SECONDS', 300))
+app.config['REFERENCE_DATA_WATCH'] = os.environ.get('REFERENCE_DATA_WATCH', '').lower() in ('1', 'true', 'yes')
+app.config['PLAN_CACHE_SIZE'] = int(os.environ.get('PLAN_CACHE_SIZE', 128))
+app.config['PLAN_CACHE_DIR'] = os.environ.get('PLAN_CACHE_DIR')
+
 mongo_client = PyMongo(app)
 db = mongo_client.db
 
-from app import classes
 from app import routes
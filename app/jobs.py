@@ -0,0 +1,166 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+STAGES = ('init', 'daily', 'bio_month', 'yearly', 'optimize', 'export')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+JOB_STATUSES = (QUEUED, RUNNING, DONE, FAILED, CANCELLED)
+# the status of the stages a job answered from the plan results cache did not run
+CACHED = 'cached'
+
+
+class JobCancelled(Exception):
+    """raised inside a running job when it reaches a stage after being cancelled"""
+
+
+class PlanJob:
+    """
+    A plan request running on the job pool.
+    the job reports the stage it is in through enter_stage, which is also where a cancelled job stops,
+    so cancelling a running job takes effect at its next stage.
+    """
+
+    def __init__(self, body: dict, stages: Tuple[str, ...] = STAGES):
+        self.id = uuid.uuid4().hex
+        self.body = body
+        self.stages = stages
+        # set by jobs that report their own progress instead of counting stages
+        self.progress: Optional[float] = None
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        self.stage_seconds: Dict[str, float] = {}
+        self.is_cached = False
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self.cancel_event = threading.Event()
+        self.future: Optional[Future] = None
+        self._stage_started_at: Optional[float] = None
+
+    def enter_stage(self, stage: str) -> None:
+        """closes the current stage and starts the next one, raises JobCancelled if the job was cancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+        self._close_stage()
+        self.stage = stage
+        self._stage_started_at = time.monotonic()
+
+    def set_cached(self) -> None:
+        """marks the job as answered from the plan results cache, the stages it did not run are cached"""
+        self.is_cached = True
+        self.progress = 1.0
+
+    def _close_stage(self) -> None:
+        if self.stage is not None:
+            self.stage_seconds[self.stage] = time.monotonic() - self._stage_started_at
+
+    def run(self, run_plan: Callable[['PlanJob'], dict], on_finished: Callable[['PlanJob'], None] = None) -> None:
+        if self.cancel_event.is_set():
+            self.status = CANCELLED
+            self.finished_at = time.time()
+            return
+
+        self.status = RUNNING
+        self.started_at = time.time()
+        try:
+            self.result = run_plan(self)
+            self._close_stage()
+            self.status = DONE
+        except JobCancelled:
+            self.status = CANCELLED
+        except Exception:
+            self.error = traceback.format_exc()
+            self.status = FAILED
+        finally:
+            self.finished_at = time.time()
+            if on_finished is not None:
+                on_finished(self)
+
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def to_dict(self) -> dict:
+        stages = {}
+        for stage in self.stages:
+            if stage in self.stage_seconds:
+                stages[stage] = {'status': DONE, 'seconds': round(self.stage_seconds[stage], 3)}
+            elif stage == self.stage and self.status == RUNNING:
+                stages[stage] = {'status': RUNNING, 'seconds': round(time.monotonic() - self._stage_started_at, 3)}
+            else:
+                stages[stage] = {'status': CACHED if self.is_cached else 'pending'}
+
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress if self.progress is not None else len(self.stage_seconds) / len(self.stages),
+            'stages': stages,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Runs plan jobs on a bounded thread pool, at most max_workers jobs run at once and the rest wait in order.
+    only the last max_finished_jobs finished jobs are kept, on_finished is called with every job that ran.
+    """
+
+    def __init__(self, max_workers: int, max_finished_jobs: int = 100,
+                 on_finished: Callable[[PlanJob], None] = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='plan-job')
+        self.max_finished_jobs = max_finished_jobs
+        self.on_finished = on_finished
+        self.jobs: Dict[str, PlanJob] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, body: dict, run_plan: Callable[[PlanJob], dict], stages: Tuple[str, ...] = STAGES) -> PlanJob:
+        job = PlanJob(body, stages)
+        with self.lock:
+            self.prune()
+            self.jobs[job.id] = job
+        job.future = self.executor.submit(job.run, run_plan, self.on_finished)
+
+        return job
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[PlanJob]:
+        """cancels a queued job at once and a running job at its next stage, return None for an unknown job"""
+        job = self.get(job_id)
+        if job is None or job.is_finished():
+            return job
+
+        job.cancel_event.set()
+        if job.future.cancel():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+
+        return job
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(Counter(job.status for job in self.jobs.values()))
+
+    def prune(self) -> None:
+        finished_jobs = [job_id for job_id, job in self.jobs.items() if job.is_finished()]
+        for job_id in finished_jobs[:max(len(finished_jobs) - self.max_finished_jobs, 0)]:
+            del self.jobs[job_id]
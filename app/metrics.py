@@ -0,0 +1,137 @@
+import cProfile
+import io
+import pstats
+import resource
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+PROFILES = ('cpu', 'memory')
+
+# tracemalloc traces the whole process, it is started by the first running memory profile and stopped by the last
+memory_profiles = 0
+memory_profiles_lock = threading.Lock()
+
+
+class MetricsRegistry:
+    """
+    In process counters, gauges and summaries, rendered in the prometheus text format.
+    a summary keeps the <name>_sum and <name>_count of its observations.
+    """
+
+    def __init__(self):
+        self.descriptions: Dict[str, Tuple[str, str]] = {}
+        self.values: Dict[str, Dict[tuple, float]] = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, description: str) -> None:
+        self.descriptions[name] = (metric_type, description)
+        self.values[name] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = self.values[name].get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self.lock:
+            self.values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            sums, counts = self.values[name].setdefault(key, (0, 0))
+            self.values[name][key] = (sums + value, counts + 1)
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (metric_type, description) in self.descriptions.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for key, value in self.values[name].items():
+                    if metric_type == 'summary':
+                        lines.append(f'{name}_sum{format_labels(key)} {value[0]}')
+                        lines.append(f'{name}_count{format_labels(key)} {value[1]}')
+                    else:
+                        lines.append(f'{name}{format_labels(key)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(key: tuple) -> str:
+    if not key:
+        return ''
+
+    return '{' + ','.join(f'{label}="{value}"' for label, value in key) + '}'
+
+
+def get_peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+registry = MetricsRegistry()
+registry.describe('sorek_plan_jobs_total', 'counter', 'finished plan jobs by status')
+registry.describe('sorek_plan_jobs', 'gauge', 'plan jobs kept by the server by status')
+registry.describe('sorek_plan_stage_seconds', 'summary', 'wall time of the plan job stages')
+registry.describe('sorek_plan_selections_total', 'counter', 'cells the greedy stages selected to raise or move')
+registry.describe('sorek_plan_cells_scanned_total', 'counter', 'cells the greedy stages looked at to select them')
+registry.describe('sorek_plan_cache_total', 'counter', 'plan jobs answered from the plan results cache or planned')
+registry.describe('sorek_export_rows_total', 'counter', 'rows written to the xl exports')
+registry.describe('sorek_export_cells_total', 'counter', 'cells written to the xl exports')
+registry.describe('sorek_reference_data_load_seconds', 'summary', 'time to read the reference documents from the db')
+registry.describe('sorek_reference_data_cache_total', 'counter', 'reference data cache lookups by result')
+registry.describe('sorek_process_peak_rss_bytes', 'gauge', 'peak resident memory of the server process')
+
+
+def record_plan_metrics(plan_metrics: Dict[str, float]) -> None:
+    """adds the counters of a plan (Plan.metrics) to the registry"""
+    for name, value in plan_metrics.items():
+        if name.endswith('_selections'):
+            registry.inc('sorek_plan_selections_total', value, stage=name[:-len('_selections')])
+        elif name.endswith('_cells_scanned'):
+            registry.inc('sorek_plan_cells_scanned_total', value, stage=name[:-len('_cells_scanned')])
+        elif name in ('export_rows', 'export_cells'):
+            registry.inc(f'sorek_{name}_total', value)
+
+
+@contextmanager
+def capture_profile(profile: str, top: int = 30):
+    """
+    profiles the block with cProfile ('cpu') or tracemalloc ('memory') and fills the yielded dict with the report.
+    tracemalloc traces the whole process, so a memory profile also counts the jobs running next to it,
+    and the peak of overlapping memory profiles is the peak since the first of them started.
+    """
+    global memory_profiles
+
+    report = {'type': profile}
+    if profile == 'cpu':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            stats_output = io.StringIO()
+            pstats.Stats(profiler, stream=stats_output).sort_stats('cumulative').print_stats(top)
+            report['stats'] = stats_output.getvalue()
+    else:
+        with memory_profiles_lock:
+            if memory_profiles == 0:
+                tracemalloc.start()
+            memory_profiles += 1
+        try:
+            yield report
+        finally:
+            with memory_profiles_lock:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                memory_profiles -= 1
+                if memory_profiles == 0:
+                    tracemalloc.stop()
+            report['peak_bytes'] = peak
+            report['top'] = [str(statistic) for statistic in snapshot.statistics('lineno')[:top]]
@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from pymongo.errors import PyMongoError
+
+from app import app
+from app.metrics import registry
+from planner.reference_data import COLLECTIONS, ReferenceData
+
+
+def load_reference_data(db) -> ReferenceData:
+    """
+    reads every reference document the plan is built from from the db, in a single find_one per collection.
+    db is a pymongo database or any stand-in with the same find_one (mongomock for example).
+    """
+    documents = {collection: db[collection].find_one({}, {'_id': 0}) for collection in COLLECTIONS}
+    missing_collections = [collection for collection, document in documents.items() if document is None]
+    if missing_collections:
+        raise ValueError(f'missing reference documents in {", ".join(missing_collections)}')
+
+    return ReferenceData(**documents)
+
+
+class ReferenceDataCache:
+    """
+    Keeps the reference data, with its derived tables, in memory between plan requests.
+    the reference data is loaded again once it is older than ttl_seconds (None keeps it until it is invalidated),
+    a reload with the same content version keeps the cached ReferenceData, so caches keyed on it stay valid.
+    """
+
+    def __init__(self, load: Callable[[], ReferenceData], ttl_seconds: Optional[float] = None):
+        self.load = load
+        self.ttl_seconds = ttl_seconds
+        self.reference_data: Optional[ReferenceData] = None
+        self.loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self) -> ReferenceData:
+        with self.lock:
+            if self.reference_data is not None and not self.is_expired():
+                self.hits += 1
+                registry.inc('sorek_reference_data_cache_total', result='hit')
+                return self.reference_data
+
+            self.misses += 1
+            registry.inc('sorek_reference_data_cache_total', result='miss')
+            started_at = time.monotonic()
+            reference_data = self.load()
+            registry.observe('sorek_reference_data_load_seconds', time.monotonic() - started_at)
+            if self.reference_data is None or reference_data.version != self.reference_data.version:
+                self.reference_data = reference_data
+            self.loaded_at = time.monotonic()
+
+            return self.reference_data
+
+    def is_expired(self) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - self.loaded_at >= self.ttl_seconds
+
+    def invalidate(self) -> None:
+        """makes the next get load the reference data again"""
+        with self.lock:
+            self.loaded_at = None
+            self.reference_data = None
+
+    def watch(self, db) -> threading.Thread:
+        """
+        invalidates the cache on every change to a reference collection, from a db change stream in a daemon thread.
+        change streams need a replica set, without one the thread stops and the cache relies on its ttl.
+        """
+        pipeline = [{'$match': {'ns.coll': {'$in': list(COLLECTIONS)}}}]
+
+        def watch_changes():
+            try:
+                with db.watch(pipeline) as stream:
+                    for _ in stream:
+                        self.invalidate()
+            except PyMongoError as error:
+                app.logger.warning(f'reference data change stream stopped, relying on the cache ttl: {error}')
+
+        thread = threading.Thread(target=watch_changes, name='reference-data-watch', daemon=True)
+        thread.start()
+
+        return thread
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.reference_data.version if self.reference_data else None,
+            'age_seconds': time.monotonic() - self.loaded_at if self.loaded_at is not None else None,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
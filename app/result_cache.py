@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from planner.core import SLOT_MINUTES
+
+
+def get_plan_key(body: dict, reference_data_version: str) -> tuple:
+    """
+    return the cache key of a plan request, two requests with the same key get the same plan.
+    the time budget only changes the milp and anytime engine plans, the improvement time only the anytime ones
+    and the local search time only the greedy ones.
+    """
+    engine = body.get('engine', 'greedy')
+    time_budget_ms = body.get('time_budget_ms') if engine in ('milp', 'anytime') else None
+    improve_ms = body.get('improve_ms') if engine == 'anytime' else None
+    local_search_ms = body.get('local_search_ms') if engine == 'greedy' else None
+
+    return (body['year'], float(body['target']), engine, time_budget_ms, improve_ms, local_search_ms, body.get('start'),
+            body.get('days'), body.get('slot_minutes', SLOT_MINUTES), reference_data_version)
+
+
+class PlanResultCache:
+    """
+    Keeps the results of the last max_entries plan requests, least recently used first out.
+    with a directory the results are also written there as json, so they outlive the process,
+    a result whose xl file is gone is dropped.
+    get_or_compute runs a single computation for concurrent requests with the same key,
+    the others wait for its result.
+    """
+
+    def __init__(self, max_entries: int, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.results: Dict[tuple, dict] = OrderedDict()
+        self.in_flight: Dict[tuple, threading.Event] = {}
+        self.lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get_or_compute(self, key: tuple, compute: Callable[[], dict]) -> Tuple[dict, bool]:
+        """
+        return the cached result of key, or waits for the request computing it, or computes it.
+        the second value tells if the result came from the cache. when the computing request fails,
+        the error is raised in that request only and one of the waiting requests computes the result.
+        """
+        while True:
+            with self.lock:
+                result = self.get(key)
+                if result is not None:
+                    return result, True
+
+                done_event = self.in_flight.get(key)
+                if done_event is None:
+                    done_event = self.in_flight[key] = threading.Event()
+                    break
+
+            done_event.wait()
+
+        try:
+            result = compute()
+            with self.lock:
+                self.put(key, result)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            done_event.set()
+
+        return result, False
+
+    def get(self, key: tuple) -> Optional[dict]:
+        result = self.results.get(key)
+        if result is None and self.directory:
+            result = self._read(key)
+            if result is not None:
+                self.results[key] = result
+
+        if result is None:
+            return None
+
+        if not os.path.exists(result['file']):
+            self._remove(key)
+            return None
+
+        self.results.move_to_end(key)
+        self._evict()
+        return result
+
+    def put(self, key: tuple, result: dict) -> None:
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if self.directory:
+            with open(self._get_path(key), 'w') as result_file:
+                json.dump({'key': key, 'result': result}, result_file)
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self.results) > self.max_entries:
+            self._remove(next(iter(self.results)))
+
+    def _remove(self, key: tuple) -> None:
+        self.results.pop(key, None)
+        if self.directory and os.path.exists(self._get_path(key)):
+            os.remove(self._get_path(key))
+
+    def _read(self, key: tuple) -> Optional[dict]:
+        if not os.path.exists(self._get_path(key)):
+            return None
+
+        with open(self._get_path(key)) as result_file:
+            return json.load(result_file)['result']
+
+    def _get_path(self, key: tuple) -> str:
+        return os.path.join(self.directory, hashlib.sha1(json.dumps(key).encode()).hexdigest() + '.json')
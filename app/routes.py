@@ -1,680 +1,230 @@
-from datetime import date, timedelta, datetime
-from typing import List, Tuple
+import os
 
-import numpy as np
-from nptyping import NDArray
-from flask import jsonify, request
+from flask import Response, jsonify, request
 
 from app import app, db
-from app.classes import Facility, MatrixBullet
+from app.jobs import JOB_STATUSES, STAGES, JobManager, PlanJob
+from app.metrics import PROFILES, capture_profile, get_peak_rss_bytes, record_plan_metrics, registry
+from app.reference_cache import ReferenceDataCache, load_reference_data
+from app.result_cache import PlanResultCache, get_plan_key
+from planner import plan, build_cost_curve, ENGINES, DEFAULT_MILP_TIME_BUDGET_MS, Plan, ReferenceData
+from planner.core import SLOT_MINUTES
+from planner.cost_curve import cache_cost_curve, get_cached_cost_curve
+from planner.batch import run_batch
+from planner.reference_data import OVERRIDABLE_COLLECTIONS
 
 from lib.xl_writer_reader import write_plan_to_xl
 
-ROWS = 365
-COLS = 24
 
-min_max_hp = db.min_max_hp.find_one({}, {'_id': 0})
-se = db.specific_energy.find_one({}, {'_id': 0})
+def record_job(job: PlanJob) -> None:
+    """adds the status and stage timings of a finished job to the metrics"""
+    registry.inc('sorek_plan_jobs_total', status=job.status)
+    for stage, seconds in job.stage_seconds.items():
+        registry.observe('sorek_plan_stage_seconds', seconds, stage=stage)
 
-def initialize_matrix(matrix: NDArray[MatrixBullet]) -> None:
-    """
-    initializing the matrix with dates and new empty MatrixBullet objects.
-    receive an year property from the request body.
-    """
-    # get the year parameter from the request
-    year = request.get_json()['year']
-    iterating_date = date(year, 1, 1)
-    delta = timedelta(days=1)
-
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    for i in range(rows):
-        for j in range(cols):
-            matrix[i, j] = MatrixBullet()
-            matrix[i, j].date = iterating_date
-        iterating_date += delta
-
-
-def parse_holidays():
-    holidays = db.holidays.find_one({}, {'_id': 0})
-
-    for holiday in holidays:
-        holidays[holiday]['date'] = datetime.strptime(holidays[holiday]['date'], '%d/%m/%Y').date()
-
-    return holidays
 
+plan_jobs = JobManager(app.config['PLAN_JOB_WORKERS'], on_finished=record_job)
 
-def parse_elections():
-    elections = db.elections.find_one({}, {'_id': 0})
+reference_data_cache = ReferenceDataCache(lambda: load_reference_data(db), app.config['REFERENCE_DATA_TTL_SECONDS'])
+if app.config['REFERENCE_DATA_WATCH']:
+    reference_data_cache.watch(db)
 
-    for i in range(len(elections['dates'])):
-        if elections['dates'][i] is not None:
-            elections['dates'][i] = datetime.strptime(elections['dates'][i], '%d/%m/%Y').date()
+plan_results = PlanResultCache(app.config['PLAN_CACHE_SIZE'], app.config['PLAN_CACHE_DIR'])
 
-    return elections
 
-
-def get_holiday_day_representation(holidays, date_value) -> str:
-    for holiday in holidays:
-        if date_value == holidays[holiday]['date']:
-            return holidays[holiday]['taoz']
-
-
-def initialize_taoz(matrix: NDArray[MatrixBullet]) -> None:
+def run_plan(job: PlanJob) -> dict:
     """
-    Defining the taoz type as enum for each bullet in the matrix,
-    holidays included.
+    return the result of a plan job, from the plan results cache when the same plan was already made,
+    or waits for an identical job that is running, or runs the whole plan pipeline.
     """
-    taoz = db.taoz.find_one({}, {'_id': 0})
-
-    holidays = parse_holidays()
-    elections = parse_elections()
-
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    for day in range(rows):
-        current_date = matrix[day, 0].date
-        is_holiday = True if current_date in holidays.values() else False
-        is_election = True if current_date in elections['dates'] else False
-
-        for hour in range(cols):
-            cell: MatrixBullet = matrix[day, hour]
-
-            day_representation = cell.get_day_representation()
-            if is_holiday:
-                day_representation = get_holiday_day_representation(holidays, current_date)
-            elif is_election:
-                day_representation = 'saturday_holiday'
+    reference_data = reference_data_cache.get()
 
-            cell.define_taoz(taoz[cell.get_season()][day_representation][hour])
+    profile = job.body.get('profile')
+    if profile:
+        # a profiled job always plans, a cached result has nothing to profile
+        with capture_profile(profile) as profile_report:
+            result = make_plan(job, reference_data)
+        return dict(result, cached=False, profile=profile_report)
 
+    key = get_plan_key(job.body, reference_data.version)
+    result, is_cached = plan_results.get_or_compute(key, lambda: make_plan(job, reference_data))
+    registry.inc('sorek_plan_cache_total', result='hit' if is_cached else 'miss')
+    if is_cached:
+        job.set_cached()
 
-def initialize_shutdown_dates(matrix: NDArray[MatrixBullet]) -> None:
-    """Initializing the shutdown dates with specified hours in the same date"""
-    shutdown_dates = db.shutdown_dates.find_one({}, {'_id': 0})
+    return dict(result, cached=is_cached)
 
-    for shutdown_day in shutdown_dates['days']:
-        day_index = datetime.strptime(shutdown_day['date'], '%d/%m/%Y').date().timetuple().tm_yday - 1
-        for hour in range(shutdown_day['from_hour'], shutdown_day['to_hour']):
-            matrix[day_index, hour].north_facility.shutdown = not shutdown_day['is_south_facility']
-            matrix[day_index, hour].south_facility.shutdown = shutdown_day['is_south_facility']
 
-
-def initialize_starter_production_amount(matrix: NDArray[MatrixBullet]) -> None:
+def make_plan(job: PlanJob, reference_data: ReferenceData) -> dict:
     """
-    Initializing the starter production amount for each matrix bullet.
-    It can be changed in the future.
-    Initializing the max production amount for 2 pumps as start amount.
+    runs the whole plan pipeline of a job, from its request body to the xl export.
+    an anytime job that keeps improving its plan exports the plan of its time budget first,
+    its result is the job result while the job improves it.
     """
-    starter_production_amount_index = 1
-
-    min_max_hp = db.min_max_hp.find_one({}, {'_id': 0})
-
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    production_amount_sum = 0
-    for i in range(rows):
-        for j in range(cols):
-            current_bullet: MatrixBullet = matrix[i, j]
+    body = job.body
+    engine = body.get('engine', 'greedy')
 
-            if current_bullet.north_facility.shutdown is False:
-                current_bullet.north_facility.production_amount = \
-                    min_max_hp['north'][starter_production_amount_index]['max']
-                current_bullet.north_facility.number_of_pumps = \
-                    min_max_hp['north'][starter_production_amount_index]['hp_number']
-                production_amount_sum += current_bullet.north_facility.production_amount
+    def on_plan(matrix: Plan) -> None:
+        job.result = dict(export_plan(matrix, reference_data, engine), cached=False)
 
-            if current_bullet.south_facility.shutdown is False:
-                current_bullet.south_facility.production_amount = \
-                    min_max_hp['south'][starter_production_amount_index]['max']
-                current_bullet.south_facility.number_of_pumps = \
-                    min_max_hp['south'][starter_production_amount_index]['hp_number']
-                production_amount_sum += current_bullet.south_facility.production_amount
-
-
-def initialize_se(matrix: NDArray[MatrixBullet]) -> None:
-    """
-    Initialize the se (specific energy) for each cell in the matrix
-    """
-    se = db.specific_energy.find_one({}, {'_id': 0})
-
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    for i in range(rows):
-        for j in range(cols):
-            # concat 'e_' to the number of pumps due to the key value in the object
-            bullet: MatrixBullet = matrix[i, j]
-            north_num_of_pumps = 'e_' + str(bullet.north_facility.number_of_pumps)
-            south_num_of_pumps = 'e_' + str(bullet.south_facility.number_of_pumps)
-            month = bullet.date.month - 1
-
-            if bullet.north_facility.shutdown is False:
-                bullet.north_facility.se_per_hour = se['north'][month][north_num_of_pumps]
-            if bullet.south_facility.shutdown is False:
-                bullet.south_facility.se_per_hour = se['south'][month][south_num_of_pumps]
-
-
-def initialize_kwh_price_and_limit(matrix: NDArray[MatrixBullet]) -> None:
-    """
-    Initialize the kwh price for each matrix bullet
-    """
+    matrix = plan(body['year'], body['target'], reference_data, engine,
+                  body.get('time_budget_ms', DEFAULT_MILP_TIME_BUDGET_MS), app.config['BIO_MONTH_WORKERS'],
+                  job.enter_stage, start=body.get('start'), days=body.get('days'),
+                  slot_minutes=body.get('slot_minutes', SLOT_MINUTES), improve_ms=body.get('improve_ms', 0),
+                  on_plan=on_plan, local_search_ms=body.get('local_search_ms', 0))
 
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
+    job.enter_stage('export')
+    result = export_plan(matrix, reference_data, engine)
+    record_plan_metrics(matrix.metrics)
 
-    taoz_cost_limit = db.taoz_cost_limit.find_one({}, {'_id': 0})
-    for i in range(rows):
-        for j in range(cols):
-            month = matrix[i, j].date.month - 1
-            taoz = matrix[i, j].taoz.name
+    return result
 
-            # initializing taoz_cost
-            matrix[i, j].north_facility.taoz_cost = taoz_cost_limit['taoz_cost'][month][taoz]
-            matrix[i, j].south_facility.taoz_cost = taoz_cost_limit['taoz_cost'][month][taoz]
-
-            # initializing secondary_taoz_cost
-            matrix[i, j].north_facility.secondary_taoz_cost = taoz_cost_limit['secondary_taoz_cost'][month][taoz]
-            matrix[i, j].south_facility.secondary_taoz_cost = taoz_cost_limit['secondary_taoz_cost'][month][taoz]
-
-            # initializing energy_limit
-            matrix[i, j].north_facility.kwh_energy_limit = taoz_cost_limit['energy_limit'][month][taoz]
-            matrix[i, j].south_facility.kwh_energy_limit = taoz_cost_limit['energy_limit'][month][taoz]
-
-
-def initialize_production_price(matrix: NDArray[MatrixBullet]) -> None:
-    """Initializing the production price for each matrix bullet"""
-
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    for i in range(rows):
-        for j in range(cols):
-            matrix[i, j].calculate_price()
 
+def export_plan(matrix: Plan, reference_data: ReferenceData, engine: str) -> dict:
+    """writes the plan to xl and return the result of its job, with its metrics and solver result"""
+    result = {
+        'file': write_plan_to_xl(matrix, reference_data),
+        'metrics': dict(matrix.metrics, peak_rss_bytes=get_peak_rss_bytes()),
+    }
+    if matrix.solver_result is not None:
+        result[engine] = matrix.solver_result
 
-def initialize_price(matrix: NDArray[MatrixBullet]) -> None:
-    """Initialize the price for each cell in the matrix"""
-    initialize_starter_production_amount(matrix)
-    initialize_se(matrix)
-    initialize_kwh_price_and_limit(matrix)
-    initialize_production_price(matrix)
+    return result
 
 
-def fill_matrix(matrix: NDArray[MatrixBullet]) -> None:
-    initialize_matrix(matrix)
-    initialize_taoz(matrix)
-    # initialize_shutdown_dates(matrix)
-    initialize_price(matrix)
+@app.route('/start', methods=['POST'])
+def start_algorithm():
+    """queues a plan job and returns its id, the job is followed with GET /jobs/<job_id>"""
+    body = request.get_json()
+    engine = body.get('engine', 'greedy')
+    if engine not in ENGINES:
+        return jsonify({'status': 'error', 'message': f'unknown engine {engine}'}), 400
+    if body.get('profile') and body['profile'] not in PROFILES:
+        return jsonify({'status': 'error', 'message': f"unknown profile {body['profile']}"}), 400
+    slot_minutes = body.get('slot_minutes', SLOT_MINUTES)
+    if slot_minutes <= 0 or 60 % slot_minutes:
+        return jsonify({'status': 'error', 'message': f'slot_minutes must divide an hour, got {slot_minutes}'}), 400
+    if body.get('improve_ms') and engine != 'anytime':
+        return jsonify({'status': 'error', 'message': 'improve_ms needs the anytime engine'}), 400
 
+    # a job improving its plan has an improve stage between the optimize and export stages
+    stages = STAGES[:-1] + ('improve', 'export') if body.get('improve_ms') else STAGES
+    job = plan_jobs.submit(body, run_plan, stages)
+    return jsonify({'status': 'success', 'job_id': job.id}), 202
 
-def update_hour(hour: MatrixBullet, is_north: bool, hourly_limit: int) -> None:
-    """
-    updates a specific hour number of pumps, se, production amount
-    """
-    global min_max_hp
-    global se
 
-    month = hour.date.month - 1
+def run_batch_job(job: PlanJob) -> dict:
+    """plans every scenario of a batch job across a process pool, the job progress is the share of finished scenarios"""
+    scenarios = job.body['scenarios']
+    finished_scenarios = []
 
-    production_amount_before_update = hour.get_production_amount()
+    def on_result(result: dict) -> None:
+        finished_scenarios.append(result['name'])
+        job.progress = len(finished_scenarios) / len(scenarios)
 
-    is_north_updateable = is_north and hour.north_facility.number_of_pumps < 5
-    if is_north_updateable:
-        facility: Facility = hour.north_facility
-        facility.number_of_pumps += 1
-        facility.se_per_hour = se['north'][month]['e_' + str(facility.number_of_pumps)]
-        if min_max_hp['north'][facility.number_of_pumps - 1]['max'] <= hourly_limit:
-            facility.production_amount = min_max_hp['north'][facility.number_of_pumps - 1]['max']
-        else:
-            facility.production_amount = hourly_limit
-    elif not is_north and hour.south_facility.number_of_pumps < 5:
-        facility: Facility = hour.south_facility
-        facility.number_of_pumps += 1
-        facility.se_per_hour = se['north'][month]['e_' + str(facility.number_of_pumps)]
-        if min_max_hp['south'][facility.number_of_pumps - 1]['max'] <= hourly_limit:
-            facility.production_amount = min_max_hp['south'][facility.number_of_pumps - 1]['max']
-        else:
-            facility.production_amount = hourly_limit
+    job.enter_stage('batch')
+    return run_batch(scenarios, reference_data_cache.get(), get_batch_workers(job.body.get('workers')), on_result)
 
-    hour.calculate_price()
 
-    production_amount_after_update = hour.get_production_amount()
+def get_batch_workers(requested_workers: int = None) -> int:
+    """return the workers of a batch job, the requested workers are capped by BATCH_WORKERS and the cpu count"""
+    workers = [os.cpu_count() or 1]
+    if requested_workers is not None:
+        workers.append(int(requested_workers))
+    if app.config['BATCH_WORKERS'] is not None:
+        workers.append(app.config['BATCH_WORKERS'])
 
-    return production_amount_after_update - production_amount_before_update
+    return max(1, min(workers))
 
 
-def get_cheapest_hour_of_day(day: NDArray[MatrixBullet], hourly_limit: int) -> Tuple[MatrixBullet, bool]:
+@app.route('/batch', methods=['POST'])
+def start_batch():
     """
-    finds the MIN hour of a specific day and return it with a flag
-    that checks if the north or south facility is in the limit
+    queues a batch job planning a list of scenarios in parallel, followed with GET /jobs/<job_id>
+    like a plan job, its result holds every scenario result and a comparative summary.
     """
-    cheapest_hour: MatrixBullet = day[0]
-    is_north = False
-
-    for hour in day:
-        # for intellisense
-        hour: MatrixBullet = hour
-
-        is_cheaper_hour = hour.price < cheapest_hour.price
-
-        is_in_north_limit = hour.north_facility.production_amount < hourly_limit
-        is_in_south_limit = hour.south_facility.production_amount < hourly_limit
-        if is_cheaper_hour \
-            and is_in_north_limit \
-            and not hour.north_facility.shutdown \
-            and hour.south_facility.number_of_pumps > hour.north_facility.number_of_pumps:
-            cheapest_hour = hour
-            is_north = True
-        elif is_cheaper_hour and is_in_south_limit and not hour.south_facility.shutdown:
-            cheapest_hour = hour
-            is_north = False
-
-    return cheapest_hour, is_north
+    body = request.get_json()
+    scenarios = body.get('scenarios')
+    if not scenarios:
+        return jsonify({'status': 'error', 'message': 'scenarios is missing or empty'}), 400
 
+    for scenario in scenarios:
+        if scenario.get('engine', 'greedy') not in ENGINES:
+            return jsonify({'status': 'error', 'message': f"unknown engine {scenario['engine']}"}), 400
+        unknown_collections = set(scenario.get('overrides', {})) - set(OVERRIDABLE_COLLECTIONS)
+        if unknown_collections:
+            return jsonify({'status': 'error',
+                            'message': f'cannot override {", ".join(sorted(unknown_collections))}'}), 400
 
-def update_daily_production(matrix: NDArray[MatrixBullet], production_limits) -> None:
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
+    job = plan_jobs.submit(body, run_batch_job, stages=('batch',))
+    return jsonify({'status': 'success', 'job_id': job.id}), 202
 
-    for i in range(rows):
-        for j in range(cols):
-            bullet: MatrixBullet = matrix[i, j]
-            bio_month = bullet.get_bio_month()
-            limits = production_limits[bio_month]
 
-            hourly_production_amount = bullet.north_facility.production_amount + bullet.south_facility.production_amount
-            if hourly_production_amount > limits['hourly']['max']:
-                break
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str):
+    """returns the status, stage progress and result of a plan job"""
+    job = plan_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'unknown job {job_id}'}), 404
 
-            daily_production_amount = sum(matrix[i])
-            while daily_production_amount < limits['daily']['min'] \
-                and not bullet.north_facility.shutdown \
-                    and not bullet.south_facility.shutdown:
-                # go to the cheapest hour of the day, increase the production amount as much as possible
-                cheapest_hour, is_north = get_cheapest_hour_of_day(matrix[i], limits['hourly']['max'])
-                update_hour(cheapest_hour, is_north, limits['hourly']['max'])
-                daily_production_amount = sum(matrix[i])
+    return jsonify(job.to_dict())
 
 
-def get_bio_month_production_amount(matrix: NDArray[MatrixBullet], start: int, end: int) -> int:
-    months_sum = 0
-    for i in range(start, end + 1):
-        months_sum += sum(matrix[i])
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id: str):
+    """cancels a queued plan job, a running job stops at its next stage"""
+    job = plan_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'unknown job {job_id}'}), 404
 
-    return months_sum
+    return jsonify(job.to_dict())
 
 
-def get_month_day_indices(matrix: NDArray[MatrixBullet], months: list[int]):
+@app.route('/curve', methods=['POST'])
+def cost_curve():
     """
-    return a tuple of two integers that symbolize range to iterate in the main matrix
+    return the greedy plan cost of the request target, or the whole cost-vs-target curve without a target.
+    the curve is built once for every year and reference data version.
     """
-    rows = matrix.shape[0]
-
-    if months[1] == 12:
-        return rows - 61, rows - 1
-
-    start = -1
-    for i in range(rows):
-        bullet: MatrixBullet = matrix[i, 0]
-        
-        if bullet.date.month == months[0] and start == -1:
-            start = i
-        elif bullet.date.month > months[1]:
-            end = i - 1
-
-            return start, end
-
-
-def get_expensive_hour_of_bio_month_optimized(matrix: NDArray, start: int, end: int, production_limits, visited: List[MatrixBullet]) -> tuple[MatrixBullet, bool]:
-    expensive_hour: MatrixBullet = matrix[start, 0]
-    is_north = False
-
-    cols = matrix.shape[1]
-
-    for i in range(start, end + 1):
-        for j in range(cols):
-            # for intellisense
-            hour: MatrixBullet = matrix[i, j]
-
-            is_more_expensive_hour = hour.price > expensive_hour.price
-            
-            hourly_limit = production_limits[hour.get_bio_month()]['hourly']['max']
-
-            is_in_north_hourly_limit = hour.north_facility.production_amount < hourly_limit
-            is_in_south_hourly_limit = hour.south_facility.production_amount < hourly_limit
-            if is_more_expensive_hour \
-                and is_in_north_hourly_limit \
-                and not hour.north_facility.shutdown \
-                and hour.south_facility.number_of_pumps > hour.north_facility.number_of_pumps\
-                and hour.south_facility not in visited:
-                expensive_hour = hour
-                is_north = True
-            elif is_more_expensive_hour \
-                and is_in_south_hourly_limit \
-                and not hour.south_facility.shutdown \
-                and hour.south_facility not in visited:
-                expensive_hour = hour
-                is_north = False
-
-    return expensive_hour, is_north
-
-
-def get_cheapest_hour_of_bio_month(matrix: NDArray, start: int, end: int, production_limits) -> tuple[MatrixBullet, bool]:
-    cheapest_hour: MatrixBullet = matrix[start, 0]
-    is_north = False
-
-    cols = matrix.shape[1]
-
-    for i in range(start, end + 1):
-        for j in range(cols):
-            # for intellisense
-            hour: MatrixBullet = matrix[i, j]
-
-            is_cheaper_hour = hour.price < cheapest_hour.price
-            
-            hourly_limit = production_limits[hour.get_bio_month()]['hourly']['max']
-
-            is_in_north_hourly_limit = hour.north_facility.production_amount < hourly_limit
-            is_in_south_hourly_limit = hour.south_facility.production_amount < hourly_limit
-            if is_cheaper_hour \
-                and is_in_north_hourly_limit \
-                and not hour.north_facility.shutdown \
-                and hour.south_facility.number_of_pumps > hour.north_facility.number_of_pumps:
-                cheapest_hour = hour
-                is_north = True
-            elif is_cheaper_hour and is_in_south_hourly_limit and not hour.south_facility.shutdown:
-                cheapest_hour = hour
-                is_north = False
-
-    return cheapest_hour, is_north
- 
-
-def is_bio_month_updateable(matrix: NDArray[MatrixBullet], months: list[int]\
-    , hour: MatrixBullet, is_north: bool, hourly_production_limit: int, bio_month_production_limit: int) -> bool:
-    start_day, end_day = get_month_day_indices(matrix, months)
-    bio_month_production_amount = get_bio_month_production_amount(matrix, start_day, end_day)
-
-    amount_to_add = hourly_production_limit - (hour.north_facility.production_amount if is_north else hour.south_facility.production_amount)
-    is_over_bio_month_limit = amount_to_add + bio_month_production_amount >= bio_month_production_limit
-
-    return not is_over_bio_month_limit
-
-
-def update_bio_month_production(matrix: NDArray[MatrixBullet], production_limits) -> None:
-    jan_feb_start_day, jan_feb_end_day = get_month_day_indices(matrix, [1, 2])
-    jan_feb_prod_amount = get_bio_month_production_amount(matrix, jan_feb_start_day, jan_feb_end_day)
-    while jan_feb_prod_amount < production_limits['jan_feb']['biomonthly']['min']:
-        cheapest_hour, is_north = get_cheapest_hour_of_bio_month(matrix, jan_feb_start_day, jan_feb_end_day, production_limits)
-        update_hour(cheapest_hour, is_north, production_limits['jan_feb']['hourly']['max'])
-        jan_feb_prod_amount = get_bio_month_production_amount(matrix, jan_feb_start_day, jan_feb_end_day)
-    
-    mar_apr_start_day, mar_apr_end_day = get_month_day_indices(matrix, [3, 4])
-    mar_apr_prod_amount = get_bio_month_production_amount(matrix, mar_apr_start_day, mar_apr_end_day)
-    while mar_apr_prod_amount < production_limits['mar_apr']['biomonthly']['min']:
-        cheapest_hour, is_north = get_cheapest_hour_of_bio_month(matrix, mar_apr_start_day, mar_apr_end_day, production_limits)
-        update_hour(cheapest_hour, is_north, production_limits['mar_apr']['hourly']['max'])
-        mar_apr_prod_amount = get_bio_month_production_amount(matrix, mar_apr_start_day, mar_apr_end_day)
-
-    may_jun_start_day, may_jun_end_day = get_month_day_indices(matrix, [5, 6])
-    may_jun_prod_amount = get_bio_month_production_amount(matrix, may_jun_start_day, may_jun_end_day)
-    while may_jun_prod_amount < production_limits['may_jun']['biomonthly']['min']:
-        cheapest_hour, is_north = get_cheapest_hour_of_bio_month(matrix, may_jun_start_day, may_jun_end_day, production_limits)
-        update_hour(cheapest_hour, is_north, production_limits['may_jun']['hourly']['max'])
-        may_jun_prod_amount = get_bio_month_production_amount(matrix, may_jun_start_day, may_jun_end_day)
-
-    jul_aug_start_day, jul_aug_end_day = get_month_day_indices(matrix, [7, 8])
-    jul_aug_prod_amount = get_bio_month_production_amount(matrix, jul_aug_start_day, jul_aug_end_day)
-    while jul_aug_prod_amount < production_limits['jul_aug']['biomonthly']['min']:
-        cheapest_hour, is_north = get_cheapest_hour_of_bio_month(matrix, jul_aug_start_day, jul_aug_end_day, production_limits)
-        update_hour(cheapest_hour, is_north, production_limits['jul_aug']['hourly']['max'])
-        jul_aug_prod_amount = get_bio_month_production_amount(matrix, jul_aug_start_day, jul_aug_end_day)
-
-    sep_oct_start_day, sep_oct_end_day = get_month_day_indices(matrix, [9, 10])
-    sep_oct_prod_amount = get_bio_month_production_amount(matrix, sep_oct_start_day, sep_oct_end_day)
-    while sep_oct_prod_amount < production_limits['sep_oct']['biomonthly']['min']:
-        cheapest_hour, is_north = get_cheapest_hour_of_bio_month(matrix, sep_oct_start_day, sep_oct_end_day, production_limits)
-        update_hour(cheapest_hour, is_north, production_limits['sep_oct']['hourly']['max'])
-        sep_oct_prod_amount = get_bio_month_production_amount(matrix, sep_oct_start_day, sep_oct_end_day)
-
-    nov_dec_start_day, nov_dec_end_day = get_month_day_indices(matrix, [11, 12])
-    nov_dec_prod_amount = get_bio_month_production_amount(matrix, nov_dec_start_day, nov_dec_end_day)
-    while nov_dec_prod_amount < production_limits['nov_dec']['biomonthly']['min']:
-        cheapest_hour, is_north = get_cheapest_hour_of_bio_month(matrix, nov_dec_start_day, nov_dec_end_day, production_limits)
-        update_hour(cheapest_hour, is_north, production_limits['nov_dec']['hourly']['max'])
-        nov_dec_prod_amount = get_bio_month_production_amount(matrix, nov_dec_start_day, nov_dec_end_day)
-
-
-def get_cheapest_hour_with_limits(matrix: NDArray[MatrixBullet], production_limits) -> MatrixBullet:
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    cheapest_hour: MatrixBullet = matrix[0, 0]
-
-    for i in range(rows):
-        current_bio_month = matrix[i, 0].get_bio_month()
-        for j in range(cols):
-            bullet: MatrixBullet = matrix[i, j]
-
-            if bullet.price < cheapest_hour.price and (not bullet.south_facility.shutdown or not bullet.south_facility.shutdown) \
-                and (bullet.get_production_amount() < production_limits[current_bio_month]['hourly']['max'])  \
-                and (bullet.south_facility.number_of_pumps < 5 or bullet.north_facility.number_of_pumps < 5) \
-                and (min_max_hp['north'][bullet.north_facility.number_of_pumps - 1]['max'] <= production_limits[current_bio_month]['hourly']['max']
-                or min_max_hp['south'][bullet.south_facility.number_of_pumps - 1]['max'] <= production_limits[current_bio_month]['hourly']['max']):
-                cheapest_hour = bullet
-    
-    return cheapest_hour
-
-
-def get_cheapest_hour(matrix: NDArray[MatrixBullet]) -> MatrixBullet:
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
-
-    cheapest_hour: MatrixBullet = matrix[0, 0]
-
-    for i in range(rows):
-        for j in range(cols):
-            bullet: MatrixBullet = matrix[i, j]
-
-            if bullet.price < cheapest_hour.price:
-                cheapest_hour = bullet
-    
-    return cheapest_hour
-
-
-def calculate_production_amount_to_add(bullet: MatrixBullet) -> int:
-    """return the production amount for an hour, return 0 if cannot add production to the hour"""
-    if not bullet.north_facility.shutdown and bullet.north_facility.number_of_pumps < 5:
-        return min_max_hp['north'][bullet.north_facility.number_of_pumps]['max'] - bullet.north_facility.production_amount
-    if not bullet.south_facility.shutdown and bullet.south_facility.number_of_pumps < 5:
-        return min_max_hp['south'][bullet.south_facility.number_of_pumps]['max'] - bullet.south_facility.production_amount
-
-    return 0
-
-
-def update_cheapest_hours(matrix: NDArray[MatrixBullet], production_limits) -> None:
-    target_amount = request.get_json()['target']
-    current_production_amount = sum(sum(matrix))
-
-    bio_months = {
-        'jan_feb': [1, 2],
-        'mar_apr': [3, 4],
-        'may_jun': [5, 6],
-        'jul_aug': [7, 8],
-        'sep_oct': [9, 10],
-        'nov_dec': [11, 12],
-    }
-
-    while current_production_amount < target_amount:
-        bullet = get_cheapest_hour_with_limits(matrix, production_limits)
-
-        production_amount_to_add = calculate_production_amount_to_add(bullet)
-        is_over_target = current_production_amount + calculate_production_amount_to_add(bullet) > target_amount
-        if is_over_target:
-            production_amount_to_add = target_amount - current_production_amount
-
-            if not bullet.north_facility.shutdown and bullet.north_facility.number_of_pumps < 5:
-                bullet.north_facility.production_amount += production_amount_to_add
-                # current_production_amount += production_amount_to_add
-            elif not bullet.south_facility.shutdown and bullet.south_facility.number_of_pumps < 5:
-                bullet.south_facility.production_amount += production_amount_to_add
-                # current_production_amount += production_amount_to_add
-        else:
-            if not bullet.north_facility.shutdown and bullet.north_facility.number_of_pumps < 5\
-                and is_bio_month_updateable(matrix, bio_months[bullet.get_bio_month()], bullet, True\
-                    , production_limits[bullet.get_bio_month()]['hourly']['max'], production_limits[bullet.get_bio_month()]['biomonthly']['max']):
-                production_amount_to_add = update_hour(bullet, True, production_limits[bullet.get_bio_month()]['hourly']['max'])
-                # current_production_amount += production_amount_to_add
-            elif not bullet.south_facility.shutdown and bullet.south_facility.number_of_pumps < 5\
-                and is_bio_month_updateable(matrix, bio_months[bullet.get_bio_month()], bullet, False\
-                    , production_limits[bullet.get_bio_month()]['hourly']['max'], production_limits[bullet.get_bio_month()]['biomonthly']['max']):
-                production_amount_to_add = update_hour(bullet, False, production_limits[bullet.get_bio_month()]['hourly']['max'])
-                # current_production_amount += production_amount_to_add
-
-        current_production_amount += production_amount_to_add
-
-    x = sum(sum(matrix))
-    z = current_production_amount
-    y = 5
-
-
-def update_expensive_hours(matrix: NDArray[MatrixBullet], production_limits) -> None:
-    target_amount = request.get_json()['target']
-    current_production_amount = sum(sum(matrix))
+    body = request.get_json()
+    year = body['year']
+    reference_data = reference_data_cache.get()
 
-    rows = matrix.shape[0]
-    cols = matrix.shape[1]
+    curve = get_cached_cost_curve(year, reference_data.version)
+    if curve is None:
+        curve = build_cost_curve(year, reference_data, app.config['BIO_MONTH_WORKERS'])
+        cache_cost_curve(year, reference_data.version, curve)
 
-    for i in range(rows):
-        for j in range(cols):
-            bullet: MatrixBullet = matrix[i, j]
+    response = {'status': 'success', 'max_production': curve.get_max_production()}
+    if 'target' in body:
+        response.update(curve.get_cost(body['target']))
+    else:
+        response['curve'] = curve.to_dict()
 
+    return jsonify(response)
 
-def update_yearly_production(matrix: NDArray[MatrixBullet], production_limits) -> None:
-    target_amount = request.get_json()['target']
-    current_production_amount = sum(sum(matrix))
 
-    # produce more in cheap hours
-    if target_amount > current_production_amount:
-        update_cheapest_hours(matrix, production_limits)
-    else: # produce less in expensive hours
-        update_expensive_hours(matrix, production_limits)
+@app.route('/reference-data', methods=['GET'])
+def get_reference_data_cache():
+    """returns the version, age and hit counts of the cached reference data"""
+    return jsonify(reference_data_cache.to_dict())
 
 
-def update_production_price_till_target(matrix: NDArray[MatrixBullet]) -> None:
-    """
-    Update the matrix with new amount and price consistently
-    until the target price is reached, the price will be received
-    from the request body with the name 'target'
-    """
-    production_limits = db.production_limits.find_one({}, {'_id': 0})
-
-    # matrix, production_limits
-    update_daily_production(matrix, production_limits)
-    update_bio_month_production(matrix, production_limits)
-    update_yearly_production(matrix, production_limits)
-
-
-def get_cheapest_hour_of_bio_month_optimization(matrix: NDArray, start: int, end: int, production_limits, visited: List[MatrixBullet]) -> tuple[MatrixBullet, bool]:
-    cheapest_hour: MatrixBullet = matrix[start, 0]
-    is_north = False
-
-    cols = matrix.shape[1]
-
-    for i in range(start, end + 1):
-        for j in range(cols):
-            # for intellisense
-            hour: MatrixBullet = matrix[i, j]
-
-            is_cheaper_hour = hour.price < cheapest_hour.price
-            
-            hourly_limit = production_limits[hour.get_bio_month()]['hourly']['max']
-
-            is_in_north_hourly_limit = hour.north_facility.production_amount < hourly_limit
-            is_in_south_hourly_limit = hour.south_facility.production_amount < hourly_limit
-            if is_cheaper_hour \
-                and is_in_north_hourly_limit \
-                and not hour.north_facility.shutdown \
-                and hour.south_facility.number_of_pumps > hour.north_facility.number_of_pumps \
-                and hour.north_facility not in visited:
-                cheapest_hour = hour
-                is_north = True
-            elif is_cheaper_hour \
-                and is_in_south_hourly_limit \
-                and not hour.south_facility.shutdown \
-                and hour.south_facility not in visited:
-                cheapest_hour = hour
-                is_north = False
-
-    return cheapest_hour, is_north
-
-
-def optimize_production_percentage(matrix: NDArray[MatrixBullet]):
-    production_limits = db.production_limits.find_one({}, {'_id': 0})
-    bio_months = {
-        'jan_feb': [1, 2],
-        'mar_apr': [3, 4],
-        'may_jun': [5, 6],
-        'jul_aug': [7, 8],
-        'sep_oct': [9, 10],
-        'nov_dec': [11, 12]
-    }
+@app.route('/reference-data', methods=['DELETE'])
+def invalidate_reference_data_cache():
+    """drops the cached reference data, the next plan request reads it from the db again"""
+    reference_data_cache.invalidate()
+    return jsonify({'status': 'success'})
 
-    for bio_month in bio_months:
-        # calculate how much is 97% of min production amount bio monthly
-        min_production_bio_monthly = production_limits[bio_month]['biomonthly']['min'] * 0.97
-        # calculate how much is 103% of max production amount bio monthly
-        max_production_bio_monthly = production_limits[bio_month]['biomonthly']['max'] * 1.03
-
-        visited = []
-
-        bio_month_start_index, bio_month_end_index = get_month_day_indices(matrix, bio_months[bio_month])
-        bio_month_production_amount = get_bio_month_production_amount(matrix, bio_month_start_index, bio_month_end_index)
-        visited_hours_limit = (bio_month_end_index - bio_month_start_index + 1) * 2
-        while min_production_bio_monthly < bio_month_production_amount < max_production_bio_monthly and len(visited) <= visited_hours_limit:
-            # get specific bio month production amount
-            bio_month_production_amount = get_bio_month_production_amount(matrix, bio_month_start_index, bio_month_end_index)
-
-            # find the cheapest hour and change its value to 105 %
-            bio_month_cheapest_hour, is_north = get_cheapest_hour_of_bio_month_optimization(matrix, bio_month_start_index, bio_month_end_index, production_limits, visited)
-            if is_north:
-                # if bio_month_cheapest_hour.north_facility in visited:
-                #     break
-                visited.append(bio_month_cheapest_hour.north_facility)
-                bio_month_cheapest_hour.north_facility.production_amount *= 1.05
-                bio_month_cheapest_hour.north_facility.calculate_price()
-            else:
-                # if bio_month_cheapest_hour.south_facility in visited:
-                #     break
-                visited.append(bio_month_cheapest_hour.south_facility)
-                bio_month_cheapest_hour.south_facility.production_amount *= 1.05
-                bio_month_cheapest_hour.south_facility.calculate_price()
-            
-            # find the most expensive hour and change its value to 92 %
-            bio_month_expensive_hour, is_north = get_expensive_hour_of_bio_month_optimized(matrix, bio_month_start_index, bio_month_end_index, production_limits, visited)
-            if is_north:
-                # if bio_month_expensive_hour.north_facility in visited:
-                #     break
-                visited.append(bio_month_expensive_hour.north_facility)
-                bio_month_expensive_hour.north_facility.production_amount *= 0.92
-                bio_month_expensive_hour.north_facility.calculate_price()
-            else:
-                # if bio_month_expensive_hour.south_facility in visited:
-                #     break
-                visited.append(bio_month_expensive_hour.south_facility)
-                bio_month_expensive_hour.south_facility.production_amount *= 0.92
-                bio_month_expensive_hour.south_facility.calculate_price()
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """returns the server metrics in the prometheus text format"""
+    # every status is set, a status without jobs is 0 and not its last count
+    job_counts = dict.fromkeys(JOB_STATUSES, 0)
+    job_counts.update(plan_jobs.count_by_status())
+    for status, count in job_counts.items():
+        registry.set('sorek_plan_jobs', count, status=status)
+    registry.set('sorek_process_peak_rss_bytes', get_peak_rss_bytes())
 
-@app.route('/start', methods=['POST'])
-def start_algorithm():
-    matrix = np.empty([ROWS, COLS], dtype=MatrixBullet)
-    fill_matrix(matrix)
-    update_production_price_till_target(matrix)
-    prod_amount = get_bio_month_production_amount(matrix, 0, len(matrix) - 1)
-    optimize_production_percentage(matrix)
-    write_plan_to_xl(matrix)
-    return jsonify({'status': 'success'})
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,180 @@
+"""
+Times every stage of the plan pipeline over a grid of years, targets and slot widths.
+
+usage: python -m benchmarks.run [--years 2021 2024] [--targets 148000000 151700000] [--slot-minutes 60 30]
+                                [--skip-export] [--output results.json] [--save-baseline] [--tolerance 0.25]
+
+the reference data is read from the db/ fixtures, neither Mongo nor Flask is needed.
+every case runs in a process of its own, so its peak rss is its own. every stage records its wall time,
+the peak rss of the case so far and the number of objects the garbage collector tracks after it.
+the results are compared with benchmarks/baseline.json, a stage slower than its baseline by more than
+the tolerance (and by more than MIN_REGRESSION_SECONDS) is flagged and the run exits with 1.
+"""
+import argparse
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from planner.core import (fill_matrix, update_daily_production, update_bio_month_production, update_yearly_production,
+                          optimize_production_percentage)
+from planner.reference_data import load_reference_data_directory
+
+DEFAULT_YEARS = (2021, 2024)
+# both targets are above the production of the initial plan (about 145.6M), so every greedy stage runs
+DEFAULT_TARGETS = (148000000, 151700000)
+DEFAULT_SLOT_MINUTES = (60, 30)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+REFERENCE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db')
+
+# stages faster than this are too noisy to flag
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def get_case_name(year: int, target: float, slot_minutes: int) -> str:
+    return f'{year}/{target:.0f}/{slot_minutes}min'
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / 1024 ** 2 if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def run_case(year: int, target: float, slot_minutes: int, export: bool) -> dict:
+    """runs the plan pipeline of a single case stage by stage, return the measures of every stage"""
+    reference_data = load_reference_data_directory(REFERENCE_DIRECTORY)
+    stages: Dict[str, dict] = {}
+
+    def measure(stage: str, run):
+        started_at = time.perf_counter()
+        result = run()
+        stages[stage] = {
+            'seconds': time.perf_counter() - started_at,
+            'peak_rss_mb': get_peak_rss_mb(),
+            'objects': len(gc.get_objects()),
+        }
+        return result
+
+    matrix = measure('fill_matrix', lambda: fill_matrix(year, reference_data, slot_minutes=slot_minutes))
+    measure('update_daily_production', lambda: update_daily_production(matrix, reference_data))
+    measure('update_bio_month_production', lambda: update_bio_month_production(matrix, reference_data))
+    measure('update_yearly_production', lambda: update_yearly_production(matrix, reference_data, target))
+    measure('optimize_production_percentage', lambda: optimize_production_percentage(matrix, reference_data))
+
+    if export:
+        # the xl writer depends on openpyxl only, it is imported here so the planning stages run without it
+        from lib.xl_writer_reader import write_plan_to_xl
+
+        with tempfile.TemporaryDirectory() as directory:
+            working_directory = os.getcwd()
+            os.chdir(directory)
+            try:
+                measure('write_plan_to_xl', lambda: write_plan_to_xl(matrix, reference_data))
+            finally:
+                os.chdir(working_directory)
+
+    return {
+        'case': get_case_name(year, target, slot_minutes),
+        'stages': stages,
+        'seconds': sum(stage['seconds'] for stage in stages.values()),
+        'peak_rss_mb': get_peak_rss_mb(),
+        'cost': float(matrix.price.sum()),
+        'production': float(matrix.get_production_amount()),
+    }
+
+
+def run_cases(years: List[int], targets: List[float], slot_minutes: List[int], export: bool) -> List[dict]:
+    cases = [(year, target, minutes, export) for year, target, minutes in itertools.product(years, targets, slot_minutes)]
+
+    # a fresh process for every case keeps the peak rss and object counts of one case out of the next
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        return [pool.apply(run_case, case) for case in cases]
+
+
+def find_regressions(results: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """return a line for every stage slower than its baseline by more than the tolerance"""
+    regressions = []
+    for result in results:
+        baseline_stages = baseline.get(result['case'], {})
+        for stage, measures in result['stages'].items():
+            if stage not in baseline_stages:
+                continue
+
+            baseline_seconds = baseline_stages[stage]['seconds']
+            if measures['seconds'] > baseline_seconds * (1 + tolerance) \
+                    and measures['seconds'] - baseline_seconds > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{result['case']} {stage}: {measures['seconds']:.3f}s, "
+                                   f"baseline {baseline_seconds:.3f}s")
+
+    return regressions
+
+
+def print_results(results: List[dict], baseline: dict) -> None:
+    for result in results:
+        print(f"{result['case']}: {result['seconds']:.2f}s, peak rss {result['peak_rss_mb']:.0f}MB, "
+              f"cost {result['cost']:,.0f}, production {result['production']:,.0f}")
+        baseline_stages = baseline.get(result['case'], {})
+        for stage, measures in result['stages'].items():
+            baseline_seconds = baseline_stages.get(stage, {}).get('seconds')
+            compared = f' (baseline {baseline_seconds:.3f}s)' if baseline_seconds is not None else ''
+            print(f"    {stage:<32}{measures['seconds']:>9.3f}s{compared}  rss {measures['peak_rss_mb']:.0f}MB  "
+                  f"objects {measures['objects']:,}")
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results: List[dict], path: str) -> None:
+    baseline = load_baseline(path)
+    baseline.update({result['case']: result['stages'] for result in results})
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='time every stage of the plan pipeline')
+    parser.add_argument('--years', type=int, nargs='+', default=DEFAULT_YEARS)
+    parser.add_argument('--targets', type=float, nargs='+', default=DEFAULT_TARGETS)
+    parser.add_argument('--slot-minutes', type=int, nargs='+', default=DEFAULT_SLOT_MINUTES)
+    parser.add_argument('--skip-export', action='store_true', help='do not time write_plan_to_xl')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline json to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown share flagged as a regression')
+    parser.add_argument('--output', help='write the results as json to this file')
+    args = parser.parse_args(argv)
+
+    results = run_cases(args.years, args.targets, args.slot_minutes, not args.skip_export)
+    baseline = load_baseline(args.baseline)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f'baseline saved to {args.baseline}')
+        return 0
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,476 +1,211 @@
+from copy import copy
+from typing import Dict, List
 from openpyxl import Workbook
-from nptyping import NDArray
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles.cell_style import StyleArray
 from openpyxl.worksheet.worksheet import Worksheet
-from app.classes import MatrixBullet
+from planner.classes import Taoz
+from planner.plan import Plan, NORTH, SOUTH
+from planner.reference_data import ReferenceData
+from planner.report_cube import ReportCube
 from openpyxl.styles import PatternFill
-from app import db
 from datetime import datetime
+import uuid
 
-def write_plan_to_xl(matrix: NDArray[MatrixBullet]):
-  wb = Workbook()
+# shared fills of the hour cells, by taoz value
+RED_FILL = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
+GREEN_FILL = PatternFill(start_color='92D050', end_color='92D050', fill_type='solid')
+ORANGE_FILL = PatternFill(start_color='FFC000', end_color='FFC000', fill_type='solid')
+TAOZ_FILLS = {Taoz.SHEFEL.value: GREEN_FILL, Taoz.GEVA.value: ORANGE_FILL, Taoz.PISGA.value: RED_FILL}
+
+DAILY_SUM_HEADERS = ['Daily Sum', 'Date', 'Day', 'Month', 'SHEFEL Daily Sum', 'PISGA Daily Sum', 'GEVA Daily Sum']
+
+def write_plan_to_xl(matrix: Plan, reference_data: ReferenceData) -> str:
+  """
+  writes the plan to a new xl workbook in write only mode, every sheet is streamed row by row
+  from a single report cube of the plan, returns the workbook file name
+  """
+  wb = Workbook(write_only=True)
 
   create_sheets(wb)
-  write_sheets(matrix, wb)
+  write_sheets(ReportCube(matrix), wb, reference_data.holidays)
 
   now = datetime.now()
   dt_string = now.strftime("%d-%m-%Y_%H-%M")
 
-  wb.save(f'Sorek-Plan_{dt_string}.xlsx')
+  # plans exported in the same minute by concurrent jobs get their own file
+  file_name = f'Sorek-Plan_{dt_string}_{uuid.uuid4().hex[:6]}.xlsx'
+  wb.save(file_name)
 
+  return file_name
 
-def write_sheets(matrix: NDArray[MatrixBullet], wb: Workbook):
-  write_holidays_sheet(matrix, wb)
-  write_taoz_sheet(matrix, wb)
-  write_cost_sheet(matrix, wb)
-  write_total_production_amount_sheet(matrix, wb)
-  write_total_energy_consumption_sheet(matrix, wb)
-  write_production_amount_sheet(matrix, wb)
-  write_taoz_price_sheet(matrix, wb)
-  write_secondary_taoz_price_sheet(matrix, wb)
-  write_se_sheet(matrix, wb)
-  write_num_of_pumps_sheet(matrix, wb)
-  write_kwh_energy_limit_sheet(matrix, wb)
-  write_shut_down_sheet(matrix, wb)
-  write_production_cost_sheet(matrix, wb)
 
+def write_sheets(cube: ReportCube, wb: Workbook, holidays: dict):
+  day_columns = get_day_columns(cube)
+
+  write_holidays_sheet(cube, wb, holidays)
+  write_taoz_sheet(cube, wb, day_columns)
+  write_cost_sheet(cube, wb, day_columns)
+  write_total_production_amount_sheet(cube, wb, day_columns)
+  write_total_energy_consumption_sheet(cube, wb, day_columns)
+  write_production_amount_sheet(cube, wb, day_columns)
+  write_taoz_price_sheet(cube, wb, day_columns)
+  write_secondary_taoz_price_sheet(cube, wb, day_columns)
+  write_se_sheet(cube, wb, day_columns)
+  write_num_of_pumps_sheet(cube, wb, day_columns)
+  write_kwh_energy_limit_sheet(cube, wb, day_columns)
+  write_shut_down_sheet(cube, wb, day_columns)
+  write_production_cost_sheet(cube, wb, day_columns)
+
+
+def get_day_columns(cube: ReportCube) -> List[list]:
+  """
+  returns the date, day name and month columns of every day, formatted once for all the sheets
+  """
+  return [[day.strftime('%d/%m/%Y'), day.strftime('%A'), day.strftime('%m')] for day in cube.dates]
 
-def write_holidays_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  ws = wb['holidays']
 
-  ws.cell(row=1, column=1).value = 'Holidays'
-  ws.cell(row=1, column=2).value = 'Date'
-  ws.cell(row=1, column=3).value = 'Day'
+def write_holidays_sheet(cube: ReportCube, wb: Workbook, holidays: dict):
+  ws = wb['holidays']
 
-  holidays = db.holidays.find_one({}, {'_id': 0})
+  append_row(cube, ws, ['Holidays', 'Date', 'Day'])
 
-  i = 2
   for holiday in holidays:
-    ws.cell(row=i, column=1).value = holiday
-    ws.cell(row=i, column=2).value = holidays[holiday]['date']
     day = datetime.strptime(holidays[holiday]['date'], '%d/%m/%Y').date()
-    ws.cell(row=i, column=3).value = day.strftime('%A')
-    i += 1
-
-
-def write_production_cost_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_production_cost']
-  south_ws = wb['south_production_cost']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  north_ws.cell(row=1, column=25).value = 'Daily Sum'
-  south_ws.cell(row=1, column=25).value = 'Daily Sum'
-  north_ws.cell(row=1, column=26).value = 'Date'
-  south_ws.cell(row=1, column=26).value = 'Date'
-  north_ws.cell(row=1, column=27).value = 'Day'
-  south_ws.cell(row=1, column=27).value = 'Day'
-  north_ws.cell(row=1, column=28).value = 'Month'
-  south_ws.cell(row=1, column=28).value = 'Month'
-  north_ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  south_ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  north_ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  south_ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  north_ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-  south_ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-  
-  for i in range(1, len(matrix) + 1):
-    north_sum = 0
-    south_sum = 0
-    north_shefel_sum = 0
-    north_geva_sum = 0
-    north_pisga_sum = 0
-    south_shefel_sum = 0
-    south_geva_sum = 0
-    south_pisga_sum = 0
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.production_price
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.production_price
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-      north_sum += bullet.north_facility.production_price
-      south_sum += bullet.south_facility.production_price
-      if bullet.taoz.name == 'SHEFEL':
-        north_shefel_sum += bullet.north_facility.production_amount
-        south_shefel_sum += bullet.south_facility.production_amount
-      elif bullet.taoz.name == 'GEVA':
-        north_geva_sum += bullet.north_facility.production_amount
-        south_geva_sum += bullet.south_facility.production_amount
-      else:
-        north_pisga_sum += bullet.north_facility.production_amount
-        south_pisga_sum += bullet.south_facility.production_amount
-    north_ws.cell(row=i + 1, column=j + 2).value = north_sum
-    south_ws.cell(row=i + 1, column=j + 2).value = south_sum
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    north_ws.cell(row=i + 1, column=j + 6).value = north_shefel_sum
-    south_ws.cell(row=i + 1, column=j + 6).value = south_shefel_sum
-    north_ws.cell(row=i + 1, column=j + 7).value = north_geva_sum
-    south_ws.cell(row=i + 1, column=j + 7).value = south_geva_sum
-    north_ws.cell(row=i + 1, column=j + 8).value = north_pisga_sum
-    south_ws.cell(row=i + 1, column=j + 8).value = south_pisga_sum
-
-
-def write_shut_down_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_shut_down']
-  south_ws = wb['south_shut_down']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.shutdown
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.shutdown
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-    north_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def write_kwh_energy_limit_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_kwh_energy_limit']
-  south_ws = wb['south_kwh_energy_limit']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.kwh_energy_limit
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.kwh_energy_limit
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-    north_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def write_total_production_amount_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  ws = wb['total_production_amount']
-  ws.cell(row=1, column=26).value = 'Date'
-  ws.cell(row=1, column=27).value = 'Day'
-  ws.cell(row=1, column=28).value = 'Month'
-  ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-
-  write_time(ws)
-  ws.cell(row=1, column=25).value = 'Daily Sum'
-  
-  for i in range(1, len(matrix) + 1):
-    row_sum = 0
-    row_shefel_sum = 0
-    row_geva_sum = 0
-    row_pisga_sum = 0
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.production_amount + bullet.south_facility.production_amount
-      ws.cell(row=i + 1, column=j + 1).fill = color
-      row_sum += bullet.north_facility.production_amount + bullet.south_facility.production_amount
-      if bullet.taoz.name == 'SHEFEL':
-        row_shefel_sum += bullet.north_facility.production_amount
-      elif bullet.taoz.name == 'GEVA':
-        row_geva_sum += bullet.north_facility.production_amount
-      else:
-        row_pisga_sum += bullet.north_facility.production_amount
-    ws.cell(row=i + 1, column=j + 2).value = row_sum
-    ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    ws.cell(row=i + 1, column=j + 6).value = row_shefel_sum
-    ws.cell(row=i + 1, column=j + 7).value = row_geva_sum
-    ws.cell(row=i + 1, column=j + 8).value = row_pisga_sum
-
-
-def write_num_of_pumps_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_num_of_pumps']
-  south_ws = wb['south_num_of_pumps']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.number_of_pumps
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.number_of_pumps
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-    north_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def write_se_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_se']
-  south_ws = wb['south_se']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.se_per_hour
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.se_per_hour
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-    north_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def write_secondary_taoz_price_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_secondary_taoz_price']
-  south_ws = wb['south_secondary_taoz_price']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.secondary_taoz_cost
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.secondary_taoz_cost
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-    north_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def write_taoz_price_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_taoz_price']
-  south_ws = wb['south_taoz_price']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.taoz_cost
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.taoz_cost
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-    north_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def write_production_amount_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  north_ws = wb['north_production_amount']
-  south_ws = wb['south_production_amount']
-
-  write_time(north_ws)
-  write_time(south_ws)
-  north_ws.cell(row=1, column=25).value = 'Daily Sum'
-  south_ws.cell(row=1, column=25).value = 'Daily Sum'
-  north_ws.cell(row=1, column=26).value = 'Date'
-  south_ws.cell(row=1, column=26).value = 'Date'
-  north_ws.cell(row=1, column=27).value = 'Day'
-  south_ws.cell(row=1, column=27).value = 'Day'
-  north_ws.cell(row=1, column=28).value = 'Month'
-  south_ws.cell(row=1, column=28).value = 'Month'
-  north_ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  south_ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  north_ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  south_ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  north_ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-  south_ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-  
-  for i in range(1, len(matrix) + 1):
-    north_sum = 0
-    south_sum = 0
-    north_shefel_sum = 0
-    north_geva_sum = 0
-    north_pisga_sum = 0
-    south_shefel_sum = 0
-    south_geva_sum = 0
-    south_pisga_sum = 0
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      color: PatternFill = color_cell(bullet)
-      north_ws.cell(row=i + 1, column=j + 1).value = bullet.north_facility.production_amount
-      north_ws.cell(row=i + 1, column=j + 1).fill = color
-      south_ws.cell(row=i + 1, column=j + 1).value = bullet.south_facility.production_amount
-      south_ws.cell(row=i + 1, column=j + 1).fill = color
-      north_sum += bullet.north_facility.production_amount
-      south_sum += bullet.south_facility.production_amount
-      if bullet.taoz.name == 'SHEFEL':
-        north_shefel_sum += bullet.north_facility.production_amount
-        south_shefel_sum += bullet.south_facility.production_amount
-      elif bullet.taoz.name == 'GEVA':
-        north_geva_sum += bullet.north_facility.production_amount
-        south_geva_sum += bullet.south_facility.production_amount
-      else:
-        north_pisga_sum += bullet.north_facility.production_amount
-        south_pisga_sum += bullet.south_facility.production_amount
-    north_ws.cell(row=i + 1, column=j + 2).value = north_sum
-    south_ws.cell(row=i + 1, column=j + 2).value = south_sum
-    north_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    south_ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    north_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    south_ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    north_ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    south_ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    north_ws.cell(row=i + 1, column=j + 6).value = north_shefel_sum
-    south_ws.cell(row=i + 1, column=j + 6).value = south_shefel_sum
-    north_ws.cell(row=i + 1, column=j + 7).value = north_geva_sum
-    south_ws.cell(row=i + 1, column=j + 7).value = south_geva_sum
-    north_ws.cell(row=i + 1, column=j + 8).value = north_pisga_sum
-    south_ws.cell(row=i + 1, column=j + 8).value = south_pisga_sum
-
-
-def write_total_energy_consumption_sheet(matrix: NDArray[MatrixBullet], wb: Workbook) -> None:
-  ws = wb['total_energy_consumption']
-
-  write_time(ws)
-  ws.cell(row=1, column=25).value = 'Daily Sum'
-  ws.cell(row=1, column=26).value = 'Date'
-  ws.cell(row=1, column=27).value = 'Day'
-  ws.cell(row=1, column=28).value = 'Month'
-  ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-  
-  for i in range(1, len(matrix) + 1):
-    row_sum = 0
-    row_shefel_sum = 0
-    row_pisga_sum = 0
-    row_geva_sum = 0
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      energy_consumption = (bullet.north_facility.production_amount * bullet.north_facility.se_per_hour) + (bullet.south_facility.production_amount * bullet.south_facility.se_per_hour)
-      ws.cell(row=i + 1, column=j + 1).value = energy_consumption
-      ws.cell(row=i + 1, column=j + 1).fill = color_cell(bullet)
-      row_sum += energy_consumption
-      if bullet.taoz.name == 'SHEFEL':
-        row_shefel_sum += energy_consumption
-      elif bullet.taoz.name == 'GEVA':
-        row_geva_sum += energy_consumption
-      else:
-        row_pisga_sum += energy_consumption
-    ws.cell(row=i + 1, column=j + 2).value = row_sum
-    ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    ws.cell(row=i + 1, column=j + 6).value = row_shefel_sum
-    ws.cell(row=i + 1, column=j + 7).value = row_geva_sum
-    ws.cell(row=i + 1, column=j + 8).value = row_pisga_sum
-
-
-def write_cost_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  ws = wb['cost']
-
-  write_time(ws)
-  ws.cell(row=1, column=25).value = 'Daily Sum'
-  ws.cell(row=1, column=26).value = 'Date'
-  ws.cell(row=1, column=27).value = 'Day'
-  ws.cell(row=1, column=28).value = 'Month'
-  ws.cell(row=1, column=29).value = 'SHEFEL Daily Sum'
-  ws.cell(row=1, column=31).value = 'GEVA Daily Sum'
-  ws.cell(row=1, column=30).value = 'PISGA Daily Sum'
-
-  
-  for i in range(1, len(matrix) + 1):
-    row_sum = 0
-    row_shefel_sum = 0
-    row_pisga_sum = 0
-    row_geva_sum = 0
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      ws.cell(row=i + 1, column=j + 1).value = bullet.price
-      ws.cell(row=i + 1, column=j + 1).fill = color_cell(bullet)
-      row_sum += bullet.price
-      if bullet.taoz.name == 'SHEFEL':
-        row_shefel_sum += bullet.price
-      elif bullet.taoz.name == 'GEVA':
-        row_geva_sum += bullet.price
-      else:
-        row_pisga_sum += bullet.price
-    ws.cell(row=i + 1, column=j + 2).value = row_sum
-    ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%d/%m/%Y')
-    ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%A')
-    ws.cell(row=i + 1, column=j + 5).value = bullet.date.strftime('%m')
-    ws.cell(row=i + 1, column=j + 6).value = row_shefel_sum
-    ws.cell(row=i + 1, column=j + 7).value = row_geva_sum
-    ws.cell(row=i + 1, column=j + 8).value = row_pisga_sum
-
-
-def write_taoz_sheet(matrix: NDArray[MatrixBullet], wb: Workbook):
-  ws = wb['taoz']
-
-  write_time(ws)
-  
-  for i in range(1, len(matrix) + 1):
-    for j in range(len(matrix[i - 1])):
-      bullet: MatrixBullet = matrix[i - 1, j]
-      ws.cell(row=i + 1, column=j + 1).value = bullet.taoz.name
-      ws.cell(row=i + 1, column=j + 1).fill = color_cell(bullet)
-    ws.cell(row=i + 1, column=j + 2).value = bullet.date.strftime('%d/%m/%Y')
-    ws.cell(row=i + 1, column=j + 3).value = bullet.date.strftime('%A')
-    ws.cell(row=i + 1, column=j + 4).value = bullet.date.strftime('%m')
-
-
-def color_cell(bullet: MatrixBullet) -> None:
+    append_row(cube, ws, [holiday, holidays[holiday]['date'], day.strftime('%A')])
+
+
+def write_production_cost_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  for facility, facility_name in ((NORTH, 'north'), (SOUTH, 'south')):
+    write_daily_sum_sheet(cube, wb[f'{facility_name}_production_cost'], cube.get_hours('production_price', facility),
+                          cube.get_daily_sum('production_price', facility),
+                          cube.get_taoz_daily_sums('production_amount', facility), day_columns)
+
+
+def write_shut_down_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_facility_sheets(cube, wb, 'shut_down', 'shutdown', day_columns)
+
+
+def write_kwh_energy_limit_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_facility_sheets(cube, wb, 'kwh_energy_limit', 'kwh_energy_limit', day_columns)
+
+
+def write_total_production_amount_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  # the taoz sums of this sheet only count the north facility
+  write_daily_sum_sheet(cube, wb['total_production_amount'], cube.get_hours('production_amount'),
+                        cube.get_daily_sum('production_amount'),
+                        cube.get_taoz_daily_sums('production_amount', NORTH), day_columns)
+
+
+def write_num_of_pumps_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_facility_sheets(cube, wb, 'num_of_pumps', 'number_of_pumps', day_columns)
+
+
+def write_se_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_facility_sheets(cube, wb, 'se', 'se_per_hour', day_columns)
+
+
+def write_secondary_taoz_price_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_facility_sheets(cube, wb, 'secondary_taoz_price', 'secondary_taoz_cost', day_columns)
+
+
+def write_taoz_price_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_facility_sheets(cube, wb, 'taoz_price', 'taoz_cost', day_columns)
+
+
+def write_production_amount_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  for facility, facility_name in ((NORTH, 'north'), (SOUTH, 'south')):
+    write_daily_sum_sheet(cube, wb[f'{facility_name}_production_amount'], cube.get_hours('production_amount', facility),
+                          cube.get_daily_sum('production_amount', facility),
+                          cube.get_taoz_daily_sums('production_amount', facility), day_columns)
+
+
+def write_total_energy_consumption_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]) -> None:
+  write_daily_sum_sheet(cube, wb['total_energy_consumption'], cube.get_hours('energy_consumption'),
+                        cube.get_daily_sum('energy_consumption'), cube.get_taoz_daily_sums('energy_consumption'),
+                        day_columns)
+
+
+def write_cost_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  write_daily_sum_sheet(cube, wb['cost'], cube.get_hours('production_price'), cube.get_daily_sum('production_price'),
+                        cube.get_taoz_daily_sums('production_price'), day_columns)
+
+
+def write_taoz_sheet(cube: ReportCube, wb: Workbook, day_columns: List[list]):
+  taoz_names = [taoz.name for taoz in Taoz]
+  taoz_values = [[taoz_names[taoz] for taoz in day_taoz] for day_taoz in cube.taoz.tolist()]
+
+  write_hours_sheet(cube, wb['taoz'], taoz_values, day_columns)
+
+
+def write_facility_sheets(cube: ReportCube, wb: Workbook, sheet_name: str, metric: str,
+                          day_columns: List[list]) -> None:
+  """
+  writes the north_<sheet_name> and south_<sheet_name> sheets of a metric
   """
-  checks the taoz type of the bullet and returns a color matching the taoz
+  write_hours_sheet(cube, wb[f'north_{sheet_name}'], cube.get_hours(metric, NORTH).tolist(), day_columns)
+  write_hours_sheet(cube, wb[f'south_{sheet_name}'], cube.get_hours(metric, SOUTH).tolist(), day_columns)
+
+
+def write_hours_sheet(cube: ReportCube, ws: Worksheet, values: List[list], day_columns: List[list]) -> None:
   """
-  redFill = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
-  greenFill = PatternFill(start_color='92D050', end_color='92D050', fill_type='solid')
-  orangeFill = PatternFill(start_color='FFC000', end_color='FFC000', fill_type='solid')
+  writes a row for every day with the colored hour values followed by the date, day and month
+  """
+  write_time(cube, ws)
+  taoz_styles = get_taoz_styles(ws)
+
+  for day_taoz, day_values, day_column in zip(cube.taoz.tolist(), values, day_columns):
+    append_row(cube, ws, color_row(ws, day_values, day_taoz, taoz_styles) + day_column)
 
-  if bullet.taoz.name == 'SHEFEL':
-    color_to_return = greenFill
-  elif bullet.taoz.name == 'PISGA':
-    color_to_return = redFill
-  else:
-    color_to_return = orangeFill
 
-  return color_to_return
+def write_daily_sum_sheet(cube: ReportCube, ws: Worksheet, values, daily_sums, taoz_daily_sums,
+                          day_columns: List[list]) -> None:
+  """
+  writes a row for every day with the colored hour values, the daily sum, the date, day and month
+  and the SHEFEL, GEVA and PISGA daily sums
+  """
+  write_time(cube, ws, DAILY_SUM_HEADERS)
+  taoz_styles = get_taoz_styles(ws)
+
+  taoz_daily_sums = taoz_daily_sums[:, [Taoz.SHEFEL.value, Taoz.GEVA.value, Taoz.PISGA.value]]
+  for day_taoz, day_values, daily_sum, day_column, day_taoz_sums in zip(cube.taoz.tolist(), values.tolist(),
+                                                                        daily_sums.tolist(), day_columns,
+                                                                        taoz_daily_sums.tolist()):
+    append_row(cube, ws, color_row(ws, day_values, day_taoz, taoz_styles) + [daily_sum] + day_column + day_taoz_sums)
+
+
+def get_taoz_styles(ws: Worksheet) -> Dict[int, StyleArray]:
+  """
+  returns the cell style of every taoz value, registered once in the workbook so the hour cells
+  only copy it instead of looking up their fill
+  """
+  taoz_styles = {}
+  for taoz, fill in TAOZ_FILLS.items():
+    cell = WriteOnlyCell(ws)
+    cell.fill = fill
+    taoz_styles[taoz] = cell._style
+
+  return taoz_styles
+
+
+def color_row(ws: Worksheet, values: list, day_taoz: List[int], taoz_styles: Dict[int, StyleArray]) -> List[WriteOnlyCell]:
+  """
+  returns the hour cells of a day, styled with the color of their taoz
+  """
+  row = []
+  for value, taoz in zip(values, day_taoz):
+    cell = WriteOnlyCell(ws, value=value)
+    cell._style = copy(taoz_styles[taoz])
+    row.append(cell)
+
+  return row
 
 
 def create_sheets(wb: Workbook) -> None:
   """
   create the sheets for the xl workbook
   """
-  ws = wb.active
-  ws.title = 'taoz'
+  wb.create_sheet('taoz')
 
   wb.create_sheet('holidays')
 
@@ -497,6 +232,19 @@ def create_sheets(wb: Workbook) -> None:
   wb.create_sheet('south_production_cost')
 
 
-def write_time(ws: Worksheet) -> None:
-  for i in range(24):
-    ws.cell(row=1, column=i + 1).value = f'{i}:00'
\ No newline at end of file
+def write_time(cube: ReportCube, ws: Worksheet, headers: List[str] = ()) -> None:
+  """
+  writes the header row, the start time of every slot of the day followed by headers
+  """
+  slot_minutes = 24 * 60 // cube.hours
+  append_row(cube, ws, [f'{minutes // 60}:{minutes % 60:02d}' for minutes in range(0, 24 * 60, slot_minutes)]
+             + list(headers))
+
+
+def append_row(cube: ReportCube, ws: Worksheet, row: list) -> None:
+  """
+  appends a row to a sheet and counts it with its cells in the plan metrics
+  """
+  ws.append(row)
+  cube.metrics['export_rows'] += 1
+  cube.metrics['export_cells'] += len(row)
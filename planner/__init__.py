@@ -0,0 +1,3 @@
+from planner.core import plan, replan, build_cost_curve, ENGINES, DEFAULT_MILP_TIME_BUDGET_MS
+from planner.plan import Plan
+from planner.reference_data import ReferenceData
@@ -0,0 +1,154 @@
+"""
+Runs many plan scenarios across a process pool and compares them.
+
+usage: python -m planner.batch scenarios.json [--workers N] [--reference-dir db] [--output summary.json]
+
+scenarios.json holds a list of scenarios:
+    {"name": "hot summer", "year": 2021, "target": 151700000, "engine": "greedy",
+     "overrides": {"production_limits": {"jul_aug": {"hourly": {"max": 20000}}}}}
+name, engine, overrides and the start, days and slot_minutes of the horizon are optional.
+overrides are merged into the reference documents of production_limits, taoz_cost_limit and shutdown_dates,
+shutdown windows are only applied for scenarios that override shutdown_dates.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from planner.calendar_index import BIO_MONTHS
+from planner.core import plan, DEFAULT_MILP_TIME_BUDGET_MS, SLOT_MINUTES
+from planner.reference_data import ReferenceData, load_reference_data_directory
+
+# the reference data every worker process receives once, when it starts
+_worker_reference_data: Optional[ReferenceData] = None
+
+
+def _initialize_worker(reference_data: ReferenceData) -> None:
+    global _worker_reference_data
+    _worker_reference_data = reference_data
+
+
+def run_scenario(scenario: dict, reference_data: ReferenceData = None) -> dict:
+    """plans a single scenario and return its result, a failing scenario returns its error instead of raising"""
+    reference_data = reference_data or _worker_reference_data
+    overrides = scenario.get('overrides', {})
+    result = {
+        'name': scenario.get('name'),
+        'year': scenario.get('year'),
+        'target': scenario.get('target'),
+        'engine': scenario.get('engine', 'greedy'),
+    }
+
+    started_at = time.monotonic()
+    try:
+        matrix = plan(scenario['year'], scenario['target'], reference_data.with_overrides(overrides),
+                      result['engine'], scenario.get('time_budget_ms', DEFAULT_MILP_TIME_BUDGET_MS),
+                      apply_shutdown_dates='shutdown_dates' in overrides, start=scenario.get('start'),
+                      days=scenario.get('days'), slot_minutes=scenario.get('slot_minutes', SLOT_MINUTES),
+                      local_search_ms=scenario.get('local_search_ms', 0))
+    except Exception:
+        result.update({'status': 'error', 'error': traceback.format_exc(), 'seconds': time.monotonic() - started_at})
+        return result
+
+    result.update({
+        'status': 'success',
+        'cost': float(matrix.price.sum()),
+        'production': float(matrix.get_production_amount()),
+        'bio_month_production': {BIO_MONTHS[bio_month]: float(matrix.get_bio_month_production_amount(bio_month))
+                                 for bio_month in range(len(BIO_MONTHS))
+                                 if matrix.calendar.bio_month_start[bio_month] != -1},
+        'seconds': time.monotonic() - started_at,
+    })
+    if matrix.solver_result is not None:
+        result[result['engine']] = matrix.solver_result
+
+    return result
+
+
+def summarize(results: List[dict]) -> dict:
+    """
+    adds the cost per cubic meter of every successful scenario and its cost difference from the first one,
+    return the summary of the batch.
+    """
+    successful = [result for result in results if result['status'] == 'success']
+    for result in successful:
+        result['cost_per_cubic_meter'] = result['cost'] / result['production'] if result['production'] else None
+        result['cost_difference'] = result['cost'] - successful[0]['cost']
+
+    cheapest = min(successful, key=lambda result: result['cost'], default=None)
+
+    return {
+        'scenarios': len(results),
+        'failed': len(results) - len(successful),
+        'cheapest': cheapest['name'] if cheapest else None,
+        'seconds': sum(result['seconds'] for result in results),
+    }
+
+
+def run_batch(scenarios: List[dict], reference_data: ReferenceData, max_workers: int = None,
+              on_result: Callable[[dict], None] = None) -> dict:
+    """
+    plans every scenario, in a process pool when max_workers is not 1 (None uses a worker per cpu).
+    the pool workers are spawned, not forked, so a batch can run from a threaded server.
+    the reference data is sent once to every worker and the scenarios only carry their overrides.
+    on_result is called with every scenario result as soon as it is ready.
+    return the scenario results, in the scenarios order, and their comparative summary.
+    """
+    for index, scenario in enumerate(scenarios):
+        scenario.setdefault('name', f'scenario {index + 1}')
+
+    started_at = time.monotonic()
+    on_result = on_result or (lambda result: None)
+    if max_workers == 1:
+        results = []
+        for scenario in scenarios:
+            results.append(run_scenario(scenario, reference_data))
+            on_result(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_initialize_worker, initargs=(reference_data,)) as executor:
+            futures = [executor.submit(run_scenario, scenario) for scenario in scenarios]
+            for future in futures:
+                future.add_done_callback(lambda done_future: on_result(done_future.result()))
+            results = [future.result() for future in futures]
+
+    summary = summarize(results)
+    summary['wall_seconds'] = time.monotonic() - started_at
+
+    return {'results': results, 'summary': summary}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description='plan a batch of scenarios in parallel and compare them')
+    parser.add_argument('scenarios', help='json file with a list of scenarios')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per cpu)')
+    parser.add_argument('--reference-dir', default='db', help='directory of <collection>.json reference documents')
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios) as scenarios_file:
+        scenarios = json.load(scenarios_file)
+
+    batch = run_batch(scenarios, load_reference_data_directory(args.reference_dir), args.workers)
+
+    for result in batch['results']:
+        if result['status'] == 'success':
+            print(f"{result['name']}: cost {result['cost']:,.0f} production {result['production']:,.0f} "
+                  f"({result['seconds']:.1f}s)", file=sys.stderr)
+        else:
+            print(f"{result['name']}: failed", file=sys.stderr)
+
+    output = json.dumps(batch, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
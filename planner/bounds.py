@@ -0,0 +1,96 @@
+from typing import Dict
+
+import numpy as np
+
+from planner.calendar_index import BIO_MONTHS
+from planner.plan import Plan
+from planner.reference_data import ReferenceData
+
+# cubic meters a plan may be off a limit and still count as keeping it, the solver rounds production amounts
+FEASIBILITY_TOLERANCE = 1.0
+
+
+def get_limits(production_limits, period: str, bound: str) -> np.ndarray:
+    """return the 'hourly', 'daily' or 'biomonthly' 'min' or 'max' production limit of every bio month code"""
+    return np.array([production_limits[bio_month][period][bound] for bio_month in BIO_MONTHS], dtype=float)
+
+
+def get_constraint_slack(matrix: Plan, production_limits, target: float) -> Dict[str, float]:
+    """
+    return the smallest slack of every constraint family of the plan, in cubic meters: the production over the target,
+    and the distance of the closest slot (hourly), day and bio month to its min or max limit.
+    a negative slack is the production by which the worst constraint of the family is broken.
+    the hourly limits are scaled to the slot and the bio month limits to the share of the bio month the plan covers.
+    """
+    bio_months = matrix.calendar.bio_month
+    slot_production = matrix.production_amount.sum(axis=2)
+    daily_production = slot_production.sum(axis=1)
+
+    hourly_min = get_limits(production_limits, 'hourly', 'min')[bio_months, np.newaxis] * matrix.slot_hours
+    hourly_max = get_limits(production_limits, 'hourly', 'max')[bio_months, np.newaxis] * matrix.slot_hours
+    daily_min = get_limits(production_limits, 'daily', 'min')[bio_months]
+    daily_max = get_limits(production_limits, 'daily', 'max')[bio_months]
+
+    in_plan = matrix.calendar.bio_month_start != -1
+    coverage = matrix.calendar.bio_month_coverage[in_plan]
+    bio_month_production = matrix.bio_month_production_amount.sum(axis=(1, 2))[in_plan]
+    bio_month_min = get_limits(production_limits, 'biomonthly', 'min')[in_plan] * coverage
+    bio_month_max = get_limits(production_limits, 'biomonthly', 'max')[in_plan] * coverage
+
+    return {
+        'target': float(matrix.get_production_amount() - target),
+        'hourly': float(min((slot_production - hourly_min).min(), (hourly_max - slot_production).min())),
+        'daily': float(min((daily_production - daily_min).min(), (daily_max - daily_production).min())),
+        'bio_month': float(min((bio_month_production - bio_month_min).min(), (bio_month_max - bio_month_production).min())),
+    }
+
+
+def get_violation(slack: Dict[str, float]) -> float:
+    """return the production by which the constraints of a get_constraint_slack result are broken, 0 when none is"""
+    return sum(-value for value in slack.values() if value < -FEASIBILITY_TOLERANCE)
+
+
+def get_lower_bound(matrix: Plan, reference_data: ReferenceData, target: float) -> float:
+    """
+    return a lower bound of the cost (in agurot) of any plan of the matrix days reaching target.
+    every cubic meter is priced with the cheapest specific energy of its facility in its month and the cheapest
+    cubic meters are taken first, up to the hourly, daily and bio month max limits. the min limits and the pump
+    ranges are dropped, so the bound relaxes the plan constraints and no plan keeping them costs less.
+    return inf when the max limits cannot reach the target.
+    """
+    production_limits = reference_data.production_limits
+    bio_months = matrix.calendar.bio_month
+
+    # a number of pumps whose specific energy is 0 is unavailable, like in the milp engine
+    unit_cost = reference_data.cost_model.cheapest_unit_cost[matrix.calendar.month[:, np.newaxis], matrix.taoz]
+
+    capacity = (reference_data.max_hp_table.max(axis=1) * matrix.slot_hours).tolist()
+    is_available = ~matrix.shutdown & np.isfinite(unit_cost)
+
+    slot_left = np.repeat(get_limits(production_limits, 'hourly', 'max')[bio_months, np.newaxis]
+                          * matrix.slot_hours, matrix.shape[1], axis=1).tolist()
+    day_left = get_limits(production_limits, 'daily', 'max')[bio_months].tolist()
+    bio_month_left = (get_limits(production_limits, 'biomonthly', 'max')
+                      * matrix.calendar.bio_month_coverage).tolist()
+
+    bio_month_codes = bio_months.tolist()
+    cells = np.argwhere(is_available)
+    order = np.argsort(unit_cost[is_available], kind='stable')
+    target_left = target
+    cost = 0.0
+    for (day, slot, facility), cell_cost in zip(cells[order].tolist(), unit_cost[is_available][order].tolist()):
+        if target_left <= 0:
+            break
+
+        bio_month = bio_month_codes[day]
+        amount = min(capacity[facility], slot_left[day][slot], day_left[day], bio_month_left[bio_month], target_left)
+        if amount <= 0:
+            continue
+
+        slot_left[day][slot] -= amount
+        day_left[day] -= amount
+        bio_month_left[bio_month] -= amount
+        target_left -= amount
+        cost += amount * cell_cost
+
+    return cost if target_left <= 0 else np.inf
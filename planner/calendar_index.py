@@ -0,0 +1,151 @@
+import copy
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+BIO_MONTHS = ('jan_feb', 'mar_apr', 'may_jun', 'jul_aug', 'sep_oct', 'nov_dec')
+SEASONS = ('summer', 'winter', 'spring_autumn')
+DAY_REPRESENTATIONS = ('weekdays', 'friday_holiday_evening', 'saturday_holiday')
+
+# season code of each zero based month, same split as MatrixBullet.get_season
+MONTH_SEASONS = np.array([1, 1, 2, 2, 2, 2, 0, 0, 2, 2, 2, 1], dtype=np.int8)
+# day representation code of each weekday (monday == 0), same split as MatrixBullet.get_day_representation
+WEEK_DAY_REPRESENTATIONS = np.array([0, 0, 0, 0, 1, 2, 0], dtype=np.int8)
+
+DATE_FORMAT = '%d/%m/%Y'
+
+
+def get_bio_month_length(year: int, bio_month: int) -> int:
+    """return the number of days of a bio month code in a year"""
+    first_day = date(year, bio_month * 2 + 1, 1)
+    next_first_day = date(year + 1, 1, 1) if bio_month == len(BIO_MONTHS) - 1 else date(year, bio_month * 2 + 3, 1)
+
+    return (next_first_day - first_day).days
+
+
+class CalendarIndex:
+    """
+    Integer coded calendar of a horizon of days, a whole year by default, indexed by the zero based day
+    of the horizon.
+    month, bio_month, season and day_representation hold indices into MONTHS, BIO_MONTHS, SEASONS
+    and DAY_REPRESENTATIONS, day_representation already includes the holiday and election overrides.
+    bio_month_coverage holds the share of every bio month the horizon covers, 1 for a whole year.
+    the bio months are not keyed by year, so a horizon may cover every bio month only once, in a single run of days,
+    a horizon longer than a year or coming back to the bio month it started in raises ValueError.
+    """
+
+    def __init__(self, year: int, holidays, elections, start: date = None, days: int = None):
+        first_day = start or date(year, 1, 1)
+        if days is None:
+            days = (date(first_day.year + 1, 1, 1) - first_day).days
+
+        self.year = first_day.year
+        self.dates: List[date] = [first_day + timedelta(days=i) for i in range(days)]
+
+        self.month = np.array([current_date.month - 1 for current_date in self.dates], dtype=np.int8)
+        self.bio_month = self.month // 2
+        bio_month_runs = np.count_nonzero(np.diff(self.bio_month)) + 1
+        if bio_month_runs > len(np.unique(self.bio_month)):
+            raise ValueError(f'a horizon of {days} days from {first_day:{DATE_FORMAT}} covers a bio month twice, '
+                             f'a horizon can cover every bio month only once')
+        self.season = MONTH_SEASONS[self.month]
+        self.week_day = np.array([current_date.weekday() for current_date in self.dates], dtype=np.int8)
+
+        self.is_holiday = np.zeros(days, dtype=bool)
+        self.is_election = np.zeros(days, dtype=bool)
+        self.day_representation = WEEK_DAY_REPRESENTATIONS[self.week_day]
+
+        for election_date in elections['dates']:
+            day = self.get_day_index(election_date)
+            if day is not None:
+                self.is_election[day] = True
+                self.day_representation[day] = DAY_REPRESENTATIONS.index('saturday_holiday')
+
+        # holidays are applied last, a holiday representation wins over an election
+        for holiday in holidays.values():
+            day = self.get_day_index(holiday['date'])
+            if day is not None:
+                self.is_holiday[day] = True
+                self.day_representation[day] = DAY_REPRESENTATIONS.index(holiday['taoz'])
+
+        self.index_bio_months()
+
+        self.bio_month_coverage = np.zeros(len(BIO_MONTHS))
+        bio_month_days = Counter(zip((current_date.year for current_date in self.dates), self.bio_month.tolist()))
+        for (bio_month_year, bio_month), days_in_horizon in bio_month_days.items():
+            self.bio_month_coverage[bio_month] += days_in_horizon / get_bio_month_length(bio_month_year, bio_month)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def index_bio_months(self) -> None:
+        """finds the first and last day of every bio month, -1 for bio months that are not in the calendar"""
+        self.bio_month_start = np.full(len(BIO_MONTHS), -1)
+        self.bio_month_end = np.full(len(BIO_MONTHS), -1)
+
+        for bio_month in range(len(BIO_MONTHS)):
+            bio_month_days = np.flatnonzero(self.bio_month == bio_month)
+            if len(bio_month_days) > 0:
+                self.bio_month_start[bio_month] = bio_month_days[0]
+                self.bio_month_end[bio_month] = bio_month_days[-1]
+
+    def get_days(self, start: int, end: int) -> 'CalendarIndex':
+        """return the calendar of the days start to end (inclusive), day 0 of the result is day start"""
+        calendar = copy.copy(self)
+        calendar.dates = self.dates[start:end + 1]
+        for field in ('month', 'bio_month', 'season', 'week_day', 'is_holiday', 'is_election', 'day_representation'):
+            setattr(calendar, field, getattr(self, field)[start:end + 1].copy())
+        calendar.index_bio_months()
+
+        return calendar
+
+    def get_day_index(self, date_value) -> int:
+        """return the day index of a date or a 'dd/mm/yyyy' string, None if it is not in this calendar."""
+        if date_value is None:
+            return None
+        if isinstance(date_value, str):
+            date_value = datetime.strptime(date_value, DATE_FORMAT).date()
+
+        day = (date_value - self.dates[0]).days
+
+        return day if 0 <= day < len(self.dates) else None
+
+    def get_bio_month_days(self, bio_month: int) -> Tuple[int, int]:
+        """return the first and last day (inclusive) of a bio month code"""
+        return int(self.bio_month_start[bio_month]), int(self.bio_month_end[bio_month])
+
+
+# the calendar indices of the last MAX_CALENDAR_INDICES horizons, least recently used first out
+MAX_CALENDAR_INDICES = 64
+_calendar_indices: Dict[tuple, CalendarIndex] = OrderedDict()
+_calendar_indices_lock = threading.Lock()
+
+
+def get_calendar_index(year: int, holidays, elections, start: date = None, days: int = None) -> CalendarIndex:
+    """
+    return the calendar index of a year, or of days days from start, built once for every horizon
+    and holidays/elections content.
+    holidays and elections are the raw documents, with 'dd/mm/yyyy' dates.
+    """
+    key = (year, start, days,
+           tuple(sorted((str(holiday['date']), holiday['taoz']) for holiday in holidays.values())),
+           tuple(str(election_date) for election_date in elections['dates']))
+
+    with _calendar_indices_lock:
+        calendar_index = _calendar_indices.get(key)
+        if calendar_index is not None:
+            _calendar_indices.move_to_end(key)
+            return calendar_index
+
+    # built outside the lock, two threads building the same index at once both get a correct one
+    calendar_index = CalendarIndex(year, holidays, elections, start, days)
+    with _calendar_indices_lock:
+        _calendar_indices[key] = calendar_index
+        while len(_calendar_indices) > MAX_CALENDAR_INDICES:
+            _calendar_indices.popitem(last=False)
+
+    return calendar_index
@@ -0,0 +1,48 @@
+import heapq
+from typing import Callable, Iterable, List, Optional, Tuple
+
+Cell = Tuple[int, int, int]
+
+
+class CandidateHeap:
+    """
+    Priority queue of plan cells (day, hour, facility) ordered by a key, the lowest key first.
+    uses lazy invalidation: a cell key is recomputed with get_key when the cell is popped,
+    stale entries are pushed again with their current key and cells whose key became None are dropped,
+    so callers never have to find and remove entries after changing the plan.
+    selections counts the cells pop returned and scanned every entry pop looked at, stale ones included.
+    """
+
+    def __init__(self, get_key: Callable[[Cell], Optional[float]], entries: Iterable[Tuple[float, Cell]] = ()):
+        self.get_key = get_key
+        self.heap: List[Tuple[float, Cell]] = list(entries)
+        heapq.heapify(self.heap)
+        self.selections = 0
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push(self, cell: Cell) -> None:
+        """push a cell with its current key, cells without a key are ignored"""
+        key = self.get_key(cell)
+        if key is not None:
+            heapq.heappush(self.heap, (key, cell))
+
+    def pop(self) -> Optional[Tuple[float, Cell]]:
+        """return the valid cell with the lowest current key and its key, None when there is no such cell"""
+        while self.heap:
+            key, cell = heapq.heappop(self.heap)
+            self.scanned += 1
+
+            current_key = self.get_key(cell)
+            if current_key is None:
+                continue
+            if current_key != key:
+                heapq.heappush(self.heap, (current_key, cell))
+                continue
+
+            self.selections += 1
+            return key, cell
+
+        return None
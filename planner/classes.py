@@ -3,6 +3,9 @@ from datetime import date
 
 
 class Facility:
+    __slots__ = ('production_amount', 'taoz_cost', 'secondary_taoz_cost', 'se_per_hour', 'number_of_pumps',
+                 'water_cubic_meter_price', 'kwh_energy_limit', 'shutdown', 'production_price')
+
     def __init__(self, production_amount=0, taoz_cost=None, secondary_taoz_cost=None, se_per_hour=None,
                  number_of_pumps=None, water_cubic_meter_price=None, kwh_energy_limit=None):
         self.production_amount: int = production_amount
@@ -22,13 +25,28 @@ class Facility:
 
 
 class MatrixBullet:
+    """
+    an hour of the plan with its north and south facilities.
+    the taoz is kept as its small int code (Taoz.value), the taoz property returns it as a Taoz.
+    """
+
+    __slots__ = ('north_facility', 'south_facility', 'taoz_code', 'date', 'price')
+
     def __init__(self, taoz=None, init_date=None, price=None):
         self.north_facility = Facility()
         self.south_facility = Facility()
-        self.taoz: Taoz = taoz
+        self.taoz_code: int = taoz.value if taoz is not None else None
         self.date: date = init_date
         self.price: float = price
 
+    @property
+    def taoz(self) -> 'Taoz':
+        return TAOZ_BY_CODE[self.taoz_code] if self.taoz_code is not None else None
+
+    @taoz.setter
+    def taoz(self, value: 'Taoz') -> None:
+        self.taoz_code = value.value
+
     def get_production_amount(self) -> int:
         return self.north_facility.production_amount + self.south_facility.production_amount
 
@@ -43,15 +61,12 @@ class MatrixBullet:
 
     def define_taoz(self, taoz: str) -> None:
         """Initialize the taoz property to either 'SHEFEL', 'GEVA', 'PISGA'."""
-        taoz_to_assign = None
         if taoz == 'SHEFEL':
-            taoz_to_assign = Taoz.SHEFEL
+            self.taoz_code = Taoz.SHEFEL.value
         elif taoz == 'GEVA':
-            taoz_to_assign = Taoz.GEVA
+            self.taoz_code = Taoz.GEVA.value
         else:
-            taoz_to_assign = Taoz.PISGA
-
-        self.taoz = taoz_to_assign
+            self.taoz_code = Taoz.PISGA.value
 
     def get_week_day(self) -> int:
         """Return day of the week, where Monday == 0 ... Sunday == 6."""
@@ -143,3 +158,7 @@ class Taoz(Enum):
     SHEFEL = 0
     GEVA = 1
     PISGA = 2
+
+
+# the Taoz of every taoz code, a tuple lookup is cheaper than Taoz(code)
+TAOZ_BY_CODE = tuple(Taoz)
@@ -0,0 +1,852 @@
+import importlib.util
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import repeat
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from planner.bounds import FEASIBILITY_TOLERANCE, get_constraint_slack, get_lower_bound, get_violation
+from planner.calendar_index import BIO_MONTHS, SEASONS, DAY_REPRESENTATIONS, DATE_FORMAT, get_calendar_index
+from planner.candidates import CandidateHeap
+from planner.classes import Taoz
+from planner.cost_curve import CostCurve
+from planner.local_search import improve_local_search
+from planner.milp import plan_milp
+from planner.plan import Plan, FACILITIES, MAX_NUMBER_OF_PUMPS, MINUTES_PER_DAY, NORTH, SOUTH
+from planner.reference_data import ReferenceData, get_monthly_taoz_table
+
+SLOT_MINUTES = 60
+
+ENGINES = ('greedy', 'milp', 'anytime')
+DEFAULT_MILP_TIME_BUDGET_MS = 60000
+# the anytime engine only starts the milp engine with at least this much of its budget left,
+# building the milp model of a year alone takes about a second
+MIN_MILP_BUDGET_MS = 5000
+
+
+def is_past(deadline: Optional[float]) -> bool:
+    """deadline is a time.monotonic() time, or None when there is no deadline"""
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def initialize_matrix(year: int, reference_data: ReferenceData, start: Union[date, str] = None, days: int = None,
+                      slot_minutes: int = SLOT_MINUTES) -> Plan:
+    """
+    initializing the matrix as an empty columnar Plan with a row for every day of the year, leap years included,
+    or for days days from start (a date or 'dd/mm/yyyy'), and a column for every slot_minutes of the day.
+    """
+    if slot_minutes <= 0 or 60 % slot_minutes:
+        raise ValueError(f'slot_minutes must divide an hour, got {slot_minutes}')
+    if isinstance(start, str):
+        start = datetime.strptime(start, DATE_FORMAT).date()
+
+    calendar = get_calendar_index(year, reference_data.holidays, reference_data.elections, start, days)
+
+    return Plan(calendar, MINUTES_PER_DAY // slot_minutes)
+
+
+def get_taoz_table(taoz, slots_per_hour: int = 1) -> np.ndarray:
+    """
+    return the taoz document as a [season, day representation, slot] table of Taoz values,
+    every slot of an hour takes the taoz of its hour.
+    """
+    taoz_table = np.array([[[Taoz[taoz_name].value for taoz_name in taoz[season][day_representation]]
+                            for day_representation in DAY_REPRESENTATIONS]
+                           for season in SEASONS], dtype=np.int8)
+
+    return np.repeat(taoz_table, slots_per_hour, axis=-1)
+
+
+def initialize_taoz(matrix: Plan, reference_data: ReferenceData) -> None:
+    """
+    Defining the taoz type as enum for each bullet in the matrix,
+    holidays and elections included through the calendar day representation.
+    """
+    calendar = matrix.calendar
+    slots_per_hour = 60 // matrix.slot_minutes
+    matrix.taoz[:] = get_taoz_table(reference_data.taoz, slots_per_hour)[calendar.season, calendar.day_representation]
+
+
+def initialize_shutdown_dates(matrix: Plan, reference_data: ReferenceData) -> None:
+    """
+    Initializing the shutdown dates with specified hours in the same date,
+    dates outside of the plan year are ignored.
+    """
+    for shutdown_day in reference_data.shutdown_dates['days']:
+        day_index = matrix.calendar.get_day_index(shutdown_day['date'])
+        if day_index is None:
+            continue
+
+        slots_per_hour = 60 // matrix.slot_minutes
+        slots = slice(shutdown_day['from_hour'] * slots_per_hour, shutdown_day['to_hour'] * slots_per_hour)
+        matrix.shutdown[day_index, slots, SOUTH if shutdown_day['is_south_facility'] else NORTH] = True
+
+
+def initialize_starter_production_amount(matrix: Plan, reference_data: ReferenceData) -> None:
+    """
+    Initializing the starter production amount for each matrix bullet.
+    It can be changed in the future.
+    Initializing the max production amount for 2 pumps as start amount.
+    """
+    starter_production_amount_index = 1
+
+    for facility, facility_name in ((NORTH, 'north'), (SOUTH, 'south')):
+        starter_hp = reference_data.min_max_hp[facility_name][starter_production_amount_index]
+        is_working = ~matrix.shutdown[..., facility]
+
+        matrix.production_amount[..., facility][is_working] = starter_hp['max'] * matrix.slot_hours
+        matrix.number_of_pumps[..., facility][is_working] = starter_hp['hp_number']
+
+    matrix.refresh_totals()
+
+
+def initialize_se(matrix: Plan, reference_data: ReferenceData) -> None:
+    """
+    Initialize the se (specific energy) for each cell in the matrix
+    """
+    months = matrix.calendar.month.reshape(-1, 1)
+
+    for facility in (NORTH, SOUTH):
+        facility_se = reference_data.se_tables[facility][months, matrix.number_of_pumps[..., facility]]
+        is_working = ~matrix.shutdown[..., facility]
+
+        matrix.se_per_hour[..., facility][is_working] = facility_se[is_working]
+
+
+def initialize_kwh_price_and_limit(matrix: Plan, reference_data: ReferenceData) -> None:
+    """
+    Initialize the kwh price for each matrix bullet
+    """
+    taoz_cost_limit = reference_data.taoz_cost_limit
+
+    months = matrix.calendar.month.reshape(-1, 1)
+    taoz = matrix.taoz
+
+    # both facilities share the same tariffs, broadcast the [day, hour] grid over the facility axis
+    matrix.taoz_cost[:] = reference_data.taoz_cost_table[months, taoz][..., np.newaxis]
+    matrix.secondary_taoz_cost[:] = \
+        get_monthly_taoz_table(taoz_cost_limit['secondary_taoz_cost'])[months, taoz][..., np.newaxis]
+    matrix.kwh_energy_limit[:] = get_monthly_taoz_table(taoz_cost_limit['energy_limit'])[months, taoz][..., np.newaxis]
+
+
+def initialize_production_price(matrix: Plan) -> None:
+    """Initializing the production price for each matrix bullet"""
+    matrix.calculate_price()
+
+
+def initialize_price(matrix: Plan, reference_data: ReferenceData) -> None:
+    """Initialize the price for each cell in the matrix"""
+    initialize_starter_production_amount(matrix, reference_data)
+    initialize_se(matrix, reference_data)
+    initialize_kwh_price_and_limit(matrix, reference_data)
+    initialize_production_price(matrix)
+
+
+def fill_matrix(year: int, reference_data: ReferenceData, apply_shutdown_dates: bool = False,
+                start: Union[date, str] = None, days: int = None, slot_minutes: int = SLOT_MINUTES) -> Plan:
+    """
+    builds the starting plan of a year, or of days days from start (see initialize_matrix),
+    the shutdown dates are only applied when apply_shutdown_dates is set
+    """
+    matrix = initialize_matrix(year, reference_data, start, days, slot_minutes)
+    initialize_taoz(matrix, reference_data)
+    if apply_shutdown_dates:
+        initialize_shutdown_dates(matrix, reference_data)
+    matrix.apply_shutdown_dates = apply_shutdown_dates
+    initialize_price(matrix, reference_data)
+
+    return matrix
+
+
+def update_hour(matrix: Plan, reference_data: ReferenceData, day: int, hour: int, is_north: bool,
+                hourly_limit: int) -> int:
+    """
+    updates a specific hour number of pumps, se, production amount,
+    hour is a slot of the plan and hourly_limit the production limit of that slot
+    """
+    cost_model = reference_data.cost_model
+    month = matrix.calendar.month[day]
+
+    production_amount_before_update = matrix.production_amount[day, hour].sum()
+    matrix.save_slot(day, hour)
+
+    facility_index = NORTH if is_north else SOUTH
+    if matrix.number_of_pumps[day, hour, facility_index] < 5:
+        facility = (day, hour, facility_index)
+        matrix.number_of_pumps[facility] += 1
+        cost_index = (month, matrix.taoz[day, hour], facility_index, matrix.number_of_pumps[facility])
+        matrix.se_per_hour[facility] = cost_model.se[cost_index]
+        matrix.set_production_amount(*facility, min(cost_model.production[cost_index] * matrix.slot_hours,
+                                                    hourly_limit))
+
+    matrix.calculate_hour_price(day, hour)
+
+    production_amount_after_update = matrix.production_amount[day, hour].sum()
+
+    return production_amount_after_update - production_amount_before_update
+
+
+def get_north_and_south_candidates(matrix: Plan, days: slice, hourly_limit) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    return two boolean masks over the given days, one for the hours the north facility can be raised in
+    and one for the hours the south facility can be raised in.
+    hourly_limit is a scalar or an array with a limit per day.
+    """
+    production_amount = matrix.production_amount[days]
+    number_of_pumps = matrix.number_of_pumps[days]
+    shutdown = matrix.shutdown[days]
+    hourly_limit = np.reshape(hourly_limit, (-1, 1))
+
+    north_candidates = (production_amount[..., NORTH] < hourly_limit) \
+        & ~shutdown[..., NORTH] \
+        & (number_of_pumps[..., SOUTH] > number_of_pumps[..., NORTH])
+    south_candidates = (production_amount[..., SOUTH] < hourly_limit) & ~shutdown[..., SOUTH]
+
+    return north_candidates, south_candidates
+
+
+def get_extreme_candidate(prices: np.ndarray, candidates: np.ndarray, initial_price: float,
+                          cheapest: bool = True) -> int:
+    """
+    return the flat index of the first cheapest (or most expensive) candidate that beats initial_price,
+    -1 if there is no such candidate.
+    """
+    if cheapest:
+        masked_prices = np.where(candidates, prices, np.inf).ravel()
+        index = int(np.argmin(masked_prices))
+        is_better = masked_prices[index] < initial_price
+    else:
+        masked_prices = np.where(candidates, prices, -np.inf).ravel()
+        index = int(np.argmax(masked_prices))
+        is_better = masked_prices[index] > initial_price
+
+    return index if is_better else -1
+
+
+def get_cheapest_hour_of_day(matrix: Plan, day: int, hourly_limit: int) -> Tuple[int, bool]:
+    """
+    finds the MIN hour of a specific day and return it with a flag
+    that checks if the north or south facility is in the limit
+    """
+    north_candidates, south_candidates = get_north_and_south_candidates(matrix, slice(day, day + 1), hourly_limit)
+    candidates = north_candidates | south_candidates
+
+    cheapest_hour = get_extreme_candidate(matrix.price[day], candidates[0], matrix.price[day, 0])
+    if cheapest_hour == -1:
+        return 0, False
+
+    return cheapest_hour, bool(north_candidates[0, cheapest_hour])
+
+
+def update_daily_production(matrix: Plan, reference_data: ReferenceData, deadline: float = None) -> None:
+    production_limits = reference_data.production_limits
+
+    rows = matrix.shape[0]
+    cols = matrix.shape[1]
+
+    for i in range(rows):
+        if is_past(deadline):
+            break
+
+        limits = production_limits[BIO_MONTHS[matrix.calendar.bio_month[i]]]
+        hourly_limit = limits['hourly']['max'] * matrix.slot_hours
+        for j in range(cols):
+
+            hourly_production_amount = matrix.production_amount[i, j].sum()
+            if hourly_production_amount > hourly_limit:
+                break
+
+            daily_production_amount = matrix.get_daily_production_amount(i)
+            while daily_production_amount < limits['daily']['min'] \
+                and not matrix.shutdown[i, j, NORTH] \
+                    and not matrix.shutdown[i, j, SOUTH]:
+                # go to the cheapest hour of the day, increase the production amount as much as possible
+                cheapest_hour, is_north = get_cheapest_hour_of_day(matrix, i, hourly_limit)
+                matrix.metrics['daily_selections'] += 1
+                matrix.metrics['daily_cells_scanned'] += cols * len(FACILITIES)
+                if not update_hour(matrix, reference_data, i, cheapest_hour, is_north, hourly_limit):
+                    # no hour of the day can be raised anymore (the shutdown hours took its capacity)
+                    break
+                daily_production_amount = matrix.get_daily_production_amount(i)
+
+
+def get_bio_month_production_amount(matrix: Plan, start: int, end: int) -> int:
+    return matrix.daily_production_amount[start:end + 1].sum()
+
+
+def get_hourly_limits(matrix: Plan, start: int, end: int, production_limits) -> np.ndarray:
+    """return the production limit of a slot (an hour by default) of each day in the range"""
+    hourly_limits = np.array([production_limits[bio_month]['hourly']['max'] for bio_month in BIO_MONTHS])
+
+    return hourly_limits[matrix.calendar.bio_month[start:end + 1]] * matrix.slot_hours
+
+
+def get_bio_month_limits(matrix: Plan, production_limits, bio_month: int) -> Tuple[float, float]:
+    """
+    return the min and max production of a bio month code,
+    in proportion to the share of the bio month the plan horizon covers.
+    """
+    limits = production_limits[BIO_MONTHS[bio_month]]['biomonthly']
+    coverage = matrix.calendar.bio_month_coverage[bio_month]
+
+    return limits['min'] * coverage, limits['max'] * coverage
+
+
+def is_bio_month_updateable(matrix: Plan, bio_month: int\
+    , day: int, hour: int, is_north: bool, hourly_production_limit: int, bio_month_production_limit: int) -> bool:
+    bio_month_production_amount = matrix.get_bio_month_production_amount(bio_month)
+
+    amount_to_add = hourly_production_limit - matrix.production_amount[day, hour, NORTH if is_north else SOUTH]
+    is_over_bio_month_limit = amount_to_add + bio_month_production_amount >= bio_month_production_limit
+
+    return not is_over_bio_month_limit
+
+
+def record_candidates(matrix: Plan, stage: str, candidates: CandidateHeap) -> None:
+    """adds the selections and the heap entries a stage scanned to the plan metrics"""
+    matrix.metrics[f'{stage}_selections'] += candidates.selections
+    matrix.metrics[f'{stage}_cells_scanned'] += candidates.scanned
+
+
+def balance_bio_month(matrix: Plan, bio_month: int, reference_data: ReferenceData, deadline: float = None) -> Plan:
+    """
+    adds pumps in the cheapest hours of a bio month, cheapest marginal cost per cubic meter first,
+    until the bio month min production is reached or the deadline passes.
+    matrix holds the days of the bio month only (see Plan.get_days) and is returned updated,
+    so bio months can be balanced in separate processes.
+    """
+    production_limits = reference_data.production_limits
+
+    hourly_limits = get_hourly_limits(matrix, 0, matrix.shape[0] - 1, production_limits)
+    candidates = get_raise_candidates(matrix, reference_data, hourly_limits)
+
+    min_production, _ = get_bio_month_limits(matrix, production_limits, bio_month)
+    while matrix.get_bio_month_production_amount(bio_month) < min_production and not is_past(deadline):
+        candidate = candidates.pop()
+        if candidate is None:
+            break
+
+        _, (day, hour, facility) = candidate
+        update_hour(matrix, reference_data, day, hour, facility == NORTH, hourly_limits[day])
+        candidates.push((day, hour, facility))
+
+    record_candidates(matrix, 'bio_month', candidates)
+    return matrix
+
+
+def update_bio_month_production(matrix: Plan, reference_data: ReferenceData, max_workers: int = 1,
+                                deadline: float = None) -> None:
+    """
+    brings every bio month up to its min production.
+    the bio months do not share days, with max_workers > 1 they are balanced in a process pool started for the call,
+    its workers are spawned, not forked, so the stage can run from a threaded server. starting the pool and copying
+    the bio month plans to it costs more than balancing a year of hourly slots in turn (about 0.3 seconds), so the
+    pool only pays off for longer stages, like quarter hour slots, with idle cores.
+    """
+    bio_months = [bio_month for bio_month in range(len(BIO_MONTHS)) if matrix.calendar.bio_month_start[bio_month] != -1]
+    bio_month_plans = [matrix.get_days(*matrix.calendar.get_bio_month_days(bio_month)) for bio_month in bio_months]
+
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            bio_month_plans = executor.map(balance_bio_month, bio_month_plans, bio_months, repeat(reference_data),
+                                           repeat(deadline))
+    else:
+        bio_month_plans = map(balance_bio_month, bio_month_plans, bio_months, repeat(reference_data), repeat(deadline))
+
+    for bio_month, bio_month_plan in zip(bio_months, list(bio_month_plans)):
+        matrix.set_days(matrix.calendar.bio_month_start[bio_month], bio_month_plan)
+        matrix.metrics.update(bio_month_plan.metrics)
+
+
+def get_raise_candidates(matrix: Plan, reference_data: ReferenceData, hourly_limits: np.ndarray,
+                         day_mask: np.ndarray = None) -> CandidateHeap:
+    """
+    return a heap of the facilities that can get one more pump, keyed on the marginal cost
+    (in agurot) of every added cubic meter.
+    a facility is a candidate while it is not shut down, has less than the max number of pumps,
+    its hour is under the hourly limit and the added pump adds production.
+    with a day_mask only the facilities of the masked days are candidates.
+    """
+    cost_model = reference_data.cost_model
+    months = matrix.calendar.month
+
+    def get_marginal_costs(day, hour, facility):
+        number_of_pumps = np.minimum(matrix.number_of_pumps[day, hour, facility], MAX_NUMBER_OF_PUMPS - 1)
+        hourly_limit = hourly_limits[day]
+        cost_index = (months[day], matrix.taoz[day, hour], facility, number_of_pumps)
+        next_cost_index = cost_index[:-1] + (number_of_pumps + 1,)
+
+        next_production_amount = cost_model.production[next_cost_index] * matrix.slot_hours
+        production_amount = np.minimum(next_production_amount, hourly_limit)
+        amount_to_add = production_amount - matrix.production_amount[day, hour, facility]
+
+        is_candidate = ~matrix.shutdown[day, hour, facility] \
+            & (matrix.number_of_pumps[day, hour, facility] < MAX_NUMBER_OF_PUMPS) \
+            & (matrix.production_amount[day, hour].sum(axis=-1) < hourly_limit) \
+            & (amount_to_add > 0)
+
+        # a facility at the max production of its pumps, raised to the max production of the next pump,
+        # costs the marginal cost of the cost model, a facility the hourly limit caps is priced from its amounts
+        is_uncapped = (production_amount == next_production_amount) \
+            & (matrix.production_amount[day, hour, facility] == cost_model.production[cost_index] * matrix.slot_hours)
+        cost_to_add = cost_model.unit_cost[next_cost_index] * production_amount \
+            - matrix.production_price[day, hour, facility]
+        capped_marginal_costs = cost_to_add / np.where(is_candidate, amount_to_add, 1)
+
+        return np.where(is_candidate, np.where(is_uncapped, cost_model.marginal_cost[cost_index], capped_marginal_costs),
+                        np.nan)
+
+    def get_key(cell):
+        marginal_cost = get_marginal_costs(*cell)
+        return None if np.isnan(marginal_cost) else float(marginal_cost)
+
+    rows, cols = matrix.shape
+    day, hour, facility = np.meshgrid(np.arange(rows), np.arange(cols), np.arange(len(FACILITIES)), indexing='ij')
+    marginal_costs = get_marginal_costs(day, hour, facility)
+
+    is_candidate = ~np.isnan(marginal_costs)
+    if day_mask is not None:
+        is_candidate &= day_mask[:, np.newaxis, np.newaxis]
+
+    cells = np.argwhere(is_candidate)
+    entries = zip(marginal_costs[tuple(cells.T)].tolist(), map(tuple, cells.tolist()))
+
+    return CandidateHeap(get_key, entries)
+
+
+def get_cheapest_hour(matrix: Plan) -> Tuple[int, int]:
+    cheapest_hour = get_extreme_candidate(matrix.price, np.ones(matrix.shape, dtype=bool), matrix.price[0, 0])
+    if cheapest_hour == -1:
+        return 0, 0
+
+    return divmod(cheapest_hour, matrix.shape[1])
+
+
+def update_cheapest_hours(matrix: Plan, reference_data: ReferenceData, target_amount: float,
+                          steps: List[Tuple[float, float, float, float, float]] = None,
+                          day_mask: np.ndarray = None, deadline: float = None) -> None:
+    """
+    adds pumps in the cheapest hours, cheapest marginal cost per cubic meter first, until the target is reached
+    or the deadline passes.
+    the last pump only adds what is left to reach the target.
+    every step is appended to steps when given (see CostCurve), with a day_mask only the masked days are raised.
+    """
+    production_limits = reference_data.production_limits
+    current_production_amount = matrix.get_production_amount()
+    current_price = matrix.price.sum()
+
+    hourly_limits = get_hourly_limits(matrix, 0, matrix.shape[0] - 1, production_limits)
+    candidates = get_raise_candidates(matrix, reference_data, hourly_limits, day_mask)
+
+    while current_production_amount < target_amount and not is_past(deadline):
+        candidate = candidates.pop()
+        if candidate is None:
+            break
+
+        _, (day, hour, facility) = candidate
+        bio_month_code = matrix.calendar.bio_month[day]
+        is_north = facility == NORTH
+
+        # the amount left to the target caps the hour like the hourly limit does
+        production_amount_limit = min(hourly_limits[day],
+                                      matrix.production_amount[day, hour, facility] + target_amount - current_production_amount)
+
+        if is_bio_month_updateable(matrix, bio_month_code, day, hour, is_north, production_amount_limit,
+                                   get_bio_month_limits(matrix, production_limits, bio_month_code)[1]):
+            production_amount_before = matrix.production_amount[day, hour, facility]
+            price_before = matrix.production_price[day, hour, facility]
+
+            added_amount = update_hour(matrix, reference_data, day, hour, is_north, production_amount_limit)
+            current_price += matrix.production_price[day, hour, facility] - price_before
+
+            if steps is not None:
+                slope = matrix.se_per_hour[day, hour, facility] * matrix.taoz_cost[day, hour, facility] / 100
+                base = current_price - slope * (matrix.production_amount[day, hour, facility] - production_amount_before)
+                steps.append((current_production_amount, current_production_amount + added_amount,
+                              base, slope, current_price))
+
+            current_production_amount += added_amount
+            candidates.push((day, hour, facility))
+
+    record_candidates(matrix, 'yearly', candidates)
+
+
+def update_expensive_hours(matrix: Plan, reference_data: ReferenceData, target_amount: float) -> None:
+    """
+    lowering the production of the expensive hours to a target under the daily and bio monthly production
+    is not implemented, the plan keeps the production of those stages. the stage is kept so
+    update_yearly_production has a place for it.
+    """
+
+
+def update_yearly_production(matrix: Plan, reference_data: ReferenceData, target_amount: float,
+                             deadline: float = None) -> None:
+    current_production_amount = matrix.get_production_amount()
+
+    # produce more in cheap hours
+    if target_amount > current_production_amount:
+        update_cheapest_hours(matrix, reference_data, target_amount, deadline=deadline)
+    else: # produce less in expensive hours
+        update_expensive_hours(matrix, reference_data, target_amount)
+
+
+def update_production_price_till_target(matrix: Plan, reference_data: ReferenceData, target_amount: float,
+                                        bio_month_workers: int = 1, on_stage: Callable[[str], None] = None,
+                                        deadline: float = None) -> None:
+    """
+    Update the matrix with new amount and price consistently
+    until the target production amount is reached.
+    on_stage is called with the name of every stage before it starts,
+    with a deadline (time.monotonic() time) every stage stops where it is once the deadline passes,
+    and the stages after it are skipped.
+    """
+    on_stage = on_stage or (lambda stage: None)
+
+    on_stage('daily')
+    update_daily_production(matrix, reference_data, deadline)
+    on_stage('bio_month')
+    if not is_past(deadline):
+        update_bio_month_production(matrix, reference_data, bio_month_workers, deadline)
+    on_stage('yearly')
+    if not is_past(deadline):
+        update_yearly_production(matrix, reference_data, target_amount, deadline)
+
+
+def is_rebalance_candidate(matrix: Plan, day: int, hour: int, facility: int, hourly_limit: int) -> bool:
+    """
+    a facility can be rebalanced while it works under the hourly limit,
+    the north facility only while it has less pumps than the south facility.
+    """
+    if matrix.shutdown[day, hour, facility] or matrix.production_amount[day, hour, facility] >= hourly_limit:
+        return False
+
+    return facility == SOUTH or matrix.number_of_pumps[day, hour, SOUTH] > matrix.number_of_pumps[day, hour, NORTH]
+
+
+def get_rebalance_candidates(matrix: Plan, start: int, end: int, hourly_limits: np.ndarray, visited: np.ndarray,
+                             most_expensive: bool = False) -> CandidateHeap:
+    """
+    return a heap of the facilities of days start to end that can be rebalanced, ordered by their hour price,
+    cheapest first or most expensive first.
+    visited is a [days, hours, facility] exclusion bitmap, visited facilities are dropped from the heap.
+    """
+    sign = -1 if most_expensive else 1
+
+    def get_key(cell):
+        day, hour, facility = cell
+        if visited[cell] or not is_rebalance_candidate(matrix, day, hour, facility, hourly_limits[day]):
+            return None
+
+        return sign * float(matrix.price[day, hour])
+
+    north_candidates, south_candidates = get_north_and_south_candidates(matrix, slice(start, end + 1),
+                                                                        hourly_limits[start:end + 1])
+    candidates = np.stack([north_candidates, south_candidates], axis=-1) & ~visited[start:end + 1]
+
+    cells = np.argwhere(candidates)
+    cells[:, 0] += start
+    keys = sign * matrix.price[cells[:, 0], cells[:, 1]]
+
+    return CandidateHeap(get_key, zip(keys.tolist(), map(tuple, cells.tolist())))
+
+
+def optimize_production_percentage(matrix: Plan, reference_data: ReferenceData, bio_months: List[int] = None,
+                                   deadline: float = None):
+    """
+    moves production inside every bio month (or only the given bio month codes) from the most expensive hours
+    to the cheapest ones, the cheapest facility is raised to 105% and the most expensive one is lowered to 92%,
+    while the bio month stays inside 97%-103% of its limits. every facility is moved at most once.
+    the moves stop once the deadline passes.
+    """
+    production_limits = reference_data.production_limits
+
+    hourly_limits = get_hourly_limits(matrix, 0, matrix.shape[0] - 1, production_limits)
+    visited = np.zeros(matrix.production_amount.shape, dtype=bool)
+
+    for bio_month_code, bio_month in enumerate(BIO_MONTHS):
+        bio_month_start_index, bio_month_end_index = matrix.calendar.get_bio_month_days(bio_month_code)
+        if bio_month_start_index == -1 or (bio_months is not None and bio_month_code not in bio_months):
+            continue
+
+        min_production, max_production = get_bio_month_limits(matrix, production_limits, bio_month_code)
+        # calculate how much is 97% of min production amount bio monthly
+        min_production_bio_monthly = min_production * 0.97
+        # calculate how much is 103% of max production amount bio monthly
+        max_production_bio_monthly = max_production * 1.03
+
+        rebalances = (
+            (get_rebalance_candidates(matrix, bio_month_start_index, bio_month_end_index, hourly_limits, visited), 1.05),
+            (get_rebalance_candidates(matrix, bio_month_start_index, bio_month_end_index, hourly_limits, visited,
+                                      most_expensive=True), 0.92),
+        )
+
+        visited_hours = 0
+        visited_hours_limit = (bio_month_end_index - bio_month_start_index + 1) * 2
+        bio_month_production_amount = matrix.get_bio_month_production_amount(bio_month_code)
+        while min_production_bio_monthly < bio_month_production_amount < max_production_bio_monthly \
+                and visited_hours <= visited_hours_limit and not is_past(deadline):
+            is_rebalanced = False
+            for candidates, percentage in rebalances:
+                candidate = candidates.pop()
+                if candidate is None:
+                    continue
+
+                _, facility = candidate
+                visited[facility] = True
+                visited_hours += 1
+                is_rebalanced = True
+
+                matrix.set_production_amount(*facility, matrix.production_amount[facility] * percentage)
+                matrix.calculate_hour_price(*facility[:2])
+
+            if not is_rebalanced:
+                break
+
+            bio_month_production_amount = matrix.get_bio_month_production_amount(bio_month_code)
+
+        for candidates, _ in rebalances:
+            record_candidates(matrix, 'rebalance', candidates)
+
+
+def optimize_production_milp(matrix: Plan, reference_data: ReferenceData, target_amount: float,
+                             time_budget_ms: int = DEFAULT_MILP_TIME_BUDGET_MS, warm_start: Plan = None) -> dict:
+    """
+    replaces the plan with the cheapest plan the MILP engine finds within time_budget_ms, starting from warm_start.
+    """
+    return plan_milp(matrix, reference_data.production_limits, target_amount, reference_data.se_tables,
+                     reference_data.min_hp_table * matrix.slot_hours, reference_data.max_hp_table * matrix.slot_hours,
+                     time_budget_ms / 1000, warm_start)
+
+
+def get_plan_report(matrix: Plan, reference_data: ReferenceData, target: float, bound: float = None) -> dict:
+    """
+    return the cost, production, constraint slack (see get_constraint_slack) and feasibility of a plan,
+    with the lower bound of the cost of any plan reaching the target and the gap of the plan cost to it,
+    the gap is None for a plan missing the target, its cost is not comparable to the bound.
+    feasible tells if the plan keeps the target and every limit.
+    bound is another lower bound (the milp best bound), the larger of the two is reported.
+    """
+    cost = float(matrix.price.sum())
+    slack = get_constraint_slack(matrix, reference_data.production_limits, target)
+    lower_bound = max(get_lower_bound(matrix, reference_data, target), bound if bound is not None else -np.inf)
+    has_bound = np.isfinite(lower_bound)
+    reaches_target = slack['target'] >= -FEASIBILITY_TOLERANCE
+
+    return {
+        'cost': cost,
+        'production': float(matrix.get_production_amount()),
+        'slack': slack,
+        'feasible': get_violation(slack) == 0,
+        'bound': float(lower_bound) if has_bound else None,
+        'gap': (cost - lower_bound) / cost if reaches_target and has_bound and cost > 0 else None,
+    }
+
+
+def get_plan_rank(matrix: Plan, reference_data: ReferenceData, target: float) -> Tuple[float, float]:
+    """plans breaking the constraints by less rank first, then cheaper plans"""
+    slack = get_constraint_slack(matrix, reference_data.production_limits, target)
+    return get_violation(slack), float(matrix.price.sum())
+
+
+def improve_plan_milp(matrix: Plan, reference_data: ReferenceData, target: float, deadline: float) -> Optional[dict]:
+    """
+    solves the plan with the milp engine until the deadline, starting from the plan, and keeps the milp plan
+    only when it ranks before the plan (see get_plan_rank).
+    return the solver result, or None when highspy is not installed.
+    """
+    if importlib.util.find_spec('highspy') is None:
+        return None
+
+    snapshot = matrix.snapshot()
+    rank = get_plan_rank(matrix, reference_data, target)
+    solver_result = optimize_production_milp(matrix, reference_data, target,
+                                             max(deadline - time.monotonic(), 0) * 1000, warm_start=matrix.copy())
+    if get_plan_rank(matrix, reference_data, target) >= rank:
+        matrix.restore(snapshot)
+
+    return solver_result
+
+
+def optimize_anytime(matrix: Plan, reference_data: ReferenceData, target: float, deadline: float,
+                     improve_ms: int = 0, on_stage: Callable[[str], None] = None,
+                     on_plan: Callable[[Plan], None] = None) -> dict:
+    """
+    the optimize stage of the anytime engine, the greedy stages already ran with the same deadline and stopped
+    where they were when it passed.
+    the improvement stages run with the time left until the deadline and are skipped once it passed: the rebalancing
+    is kept only when the rebalanced plan ranks before the greedy plan (see get_plan_rank), then the local search
+    runs until it converges or the deadline passes and the time left, when it is at least MIN_MILP_BUDGET_MS,
+    goes to the milp engine.
+    return the plan report (see get_plan_report) with its status, 'deadline' when the deadline stopped a stage
+    and 'complete' otherwise, the local search result and the milp solver result when the milp engine ran.
+    with improve_ms, on_plan is called with the plan (its report in plan.solver_result) and the plan keeps
+    improving for improve_ms more in the 'improve' stage: the greedy stages reach the target when the deadline
+    stopped them, then the local search runs when the deadline stopped it and then the milp engine.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    on_plan = on_plan or (lambda plan: None)
+
+    def get_report(solver_result: Optional[dict], **fields) -> dict:
+        report = get_plan_report(matrix, reference_data, target, solver_result and solver_result['bound'])
+        return dict(report, **fields, local_search=local_search, milp=solver_result)
+
+    if not is_past(deadline):
+        snapshot = matrix.snapshot()
+        rank = get_plan_rank(matrix, reference_data, target)
+        optimize_production_percentage(matrix, reference_data, deadline=deadline)
+        if get_plan_rank(matrix, reference_data, target) >= rank:
+            matrix.restore(snapshot)
+    local_search = improve_local_search(matrix, reference_data, deadline)
+    status = 'deadline' if is_past(deadline) else 'complete'
+
+    solver_result = None
+    if (deadline - time.monotonic()) * 1000 >= MIN_MILP_BUDGET_MS:
+        solver_result = improve_plan_milp(matrix, reference_data, target, deadline)
+
+    report = get_report(solver_result, status=status)
+    if not improve_ms:
+        return report
+
+    matrix.solver_result = dict(report, improving=True)
+    on_plan(matrix)
+
+    on_stage('improve')
+    improve_deadline = time.monotonic() + improve_ms / 1000
+    if matrix.get_production_amount() < target:
+        update_production_price_till_target(matrix, reference_data, target, deadline=improve_deadline)
+    if local_search['status'] == 'deadline':
+        local_search = improve_local_search(matrix, reference_data, improve_deadline)
+    solver_result = improve_plan_milp(matrix, reference_data, target, improve_deadline)
+
+    return get_report(solver_result, status=status, improving=False)
+
+
+def build_cost_curve(year: int, reference_data: ReferenceData, bio_month_workers: int = 1) -> CostCurve:
+    """
+    runs the greedy stages once up to the max production the limits allow and records the cost of every step.
+    the daily and bio monthly stages do not depend on the target, so the steps of the yearly stage hold
+    the greedy plan of every target.
+    """
+    matrix = fill_matrix(year, reference_data)
+    update_daily_production(matrix, reference_data)
+    update_bio_month_production(matrix, reference_data, bio_month_workers)
+
+    steps = []
+    start_production, start_cost = matrix.get_production_amount(), matrix.price.sum()
+    update_cheapest_hours(matrix, reference_data, np.inf, steps)
+
+    return CostCurve(float(start_production), float(start_cost), steps)
+
+
+def plan(year: int, target: float, reference_data: ReferenceData, engine: str = 'greedy',
+         time_budget_ms: int = DEFAULT_MILP_TIME_BUDGET_MS, bio_month_workers: int = 1,
+         on_stage: Callable[[str], None] = None, apply_shutdown_dates: bool = False,
+         start: Union[date, str] = None, days: int = None, slot_minutes: int = SLOT_MINUTES,
+         improve_ms: int = 0, on_plan: Callable[[Plan], None] = None, local_search_ms: int = 0) -> Plan:
+    """
+    builds the production plan of a year reaching the target production amount,
+    or of days days from start in slots of slot_minutes (see initialize_matrix).
+    the bio month limits of a horizon covering part of a bio month are in proportion to that part.
+    the greedy stages always run, the 'greedy' engine then rebalances the bio months and the 'milp' engine
+    solves the plan from the greedy plan, its solver result is kept in plan.solver_result
+    (with fallback 'greedy' when it found no plan within time_budget_ms and the greedy plan was rebalanced instead).
+    with local_search_ms the 'greedy' engine improves the rebalanced plan with the local search for up to that long
+    (see improve_local_search).
+    the 'anytime' engine returns the best plan it finds within time_budget_ms, counted from the start,
+    and its report in plan.solver_result, with improve_ms it keeps improving it afterwards (see optimize_anytime).
+    on_stage is called with the name of every stage ('init', 'daily', 'bio_month', 'yearly', 'optimize')
+    before it starts, the shutdown dates are only applied with apply_shutdown_dates.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'unknown engine {engine}')
+    on_stage = on_stage or (lambda stage: None)
+    deadline = time.monotonic() + time_budget_ms / 1000 if engine == 'anytime' else None
+
+    on_stage('init')
+    matrix = fill_matrix(year, reference_data, apply_shutdown_dates, start, days, slot_minutes)
+    update_production_price_till_target(matrix, reference_data, target, bio_month_workers, on_stage, deadline)
+
+    on_stage('optimize')
+    if engine == 'milp':
+        matrix.solver_result = optimize_production_milp(matrix, reference_data, target, time_budget_ms,
+                                                        warm_start=matrix.copy())
+        if matrix.solver_result['cost'] is None:
+            # no milp plan within the budget, the plan is the rebalanced greedy plan like the 'greedy' engine
+            optimize_production_percentage(matrix, reference_data)
+            matrix.solver_result['fallback'] = 'greedy'
+    elif engine == 'anytime':
+        matrix.solver_result = optimize_anytime(matrix, reference_data, target, deadline, improve_ms, on_stage, on_plan)
+    else:
+        optimize_production_percentage(matrix, reference_data)
+        if local_search_ms:
+            improve_local_search(matrix, reference_data, time.monotonic() + local_search_ms / 1000)
+
+    return matrix
+
+
+# the plan fields that come from the reference data and not from the planning stages
+INPUT_FIELDS = ('taoz', 'shutdown', 'taoz_cost', 'secondary_taoz_cost', 'kwh_energy_limit')
+
+
+def get_changed_bio_months(prior: Plan, fresh: Plan, prior_reference_data: ReferenceData,
+                           reference_data: ReferenceData) -> List[int]:
+    """
+    return the codes of the bio months a reference data change touches: bio months with a day whose
+    shutdown hours, taoz or tariffs differ between the prior plan and a freshly filled plan,
+    and bio months whose production limits changed.
+    """
+    changed_days = np.zeros(len(prior), dtype=bool)
+    for field in INPUT_FIELDS:
+        changed_days |= (getattr(prior, field) != getattr(fresh, field)).reshape(len(prior), -1).any(axis=1)
+
+    bio_months = set(prior.calendar.bio_month[changed_days].tolist())
+    for bio_month_code, bio_month in enumerate(BIO_MONTHS):
+        if prior_reference_data.production_limits[bio_month] != reference_data.production_limits[bio_month] \
+                and prior.calendar.bio_month_start[bio_month_code] != -1:
+            bio_months.add(bio_month_code)
+
+    return sorted(bio_months)
+
+
+def replan(prior: Plan, prior_reference_data: ReferenceData, delta: dict, target: float,
+           apply_shutdown_dates: bool = None) -> Plan:
+    """
+    re-plans a greedy plan after a change to its reference data, without re-planning the whole year.
+    delta holds partial documents of the OVERRIDABLE_COLLECTIONS like a batch scenario, the new plan is built
+    for prior_reference_data.with_overrides(delta).
+    only the bio months the change touches are planned again from their starting state (daily and bio monthly
+    stages), then the yearly target is repaired by raising the cheapest hours of those bio months first and of
+    the whole year when they cannot take it, and those bio months are rebalanced again.
+    the other bio months keep their prior plan.
+    the shutdown dates are applied like in the prior plan (Plan.apply_shutdown_dates), and when delta overrides
+    shutdown_dates like in a batch scenario, unless apply_shutdown_dates says otherwise.
+    """
+    if apply_shutdown_dates is None:
+        apply_shutdown_dates = prior.apply_shutdown_dates or 'shutdown_dates' in delta
+    reference_data = prior_reference_data.with_overrides(delta)
+    fresh = fill_matrix(prior.calendar.year, reference_data, apply_shutdown_dates, prior.dates[0], len(prior),
+                        prior.slot_minutes)
+    bio_months = get_changed_bio_months(prior, fresh, prior_reference_data, reference_data)
+
+    matrix = prior.copy()
+    if not bio_months:
+        return matrix
+
+    day_mask = np.zeros(len(matrix), dtype=bool)
+    for bio_month in bio_months:
+        start, end = matrix.calendar.get_bio_month_days(bio_month)
+        bio_month_plan = fresh.get_days(start, end)
+        update_daily_production(bio_month_plan, reference_data)
+        balance_bio_month(bio_month_plan, bio_month, reference_data)
+        matrix.set_days(start, bio_month_plan)
+        matrix.metrics.update(bio_month_plan.metrics)
+        day_mask[start:end + 1] = True
+
+    update_cheapest_hours(matrix, reference_data, target, day_mask=day_mask)
+    update_cheapest_hours(matrix, reference_data, target)
+    optimize_production_percentage(matrix, reference_data, bio_months)
+
+    return matrix
@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class CostCurve:
+    """
+    Cost of the greedy plan for every target, recorded from a single greedy pass up to the max production.
+    step i adds a pump to one facility and raises the plan production from production_before[i] to production[i]
+    and the plan cost to cost[i]. a target inside a step only raises that facility part of the way, which costs
+    base[i] + slope[i] * (target - production_before[i]), the new number of pumps prices the whole facility
+    production with its own specific energy.
+    targets the plan reaches before the first step cost start_cost.
+    """
+
+    def __init__(self, start_production: float, start_cost: float,
+                 steps: List[Tuple[float, float, float, float, float]]):
+        """steps holds the (production_before, production, base, slope, cost) of every step, in greedy order"""
+        self.start_production = start_production
+        self.start_cost = start_cost
+
+        self.production_before, self.production, self.base, self.slope, self.cost = \
+            np.array(steps, dtype=float).reshape(-1, 5).T
+
+    def __len__(self) -> int:
+        return len(self.production)
+
+    def get_max_production(self) -> float:
+        return float(self.production[-1]) if len(self) > 0 else self.start_production
+
+    def get_cost(self, target_amount: float) -> dict:
+        """return the production and cost of the greedy plan for a target, the max production if it is not reachable"""
+        if target_amount <= self.start_production or len(self) == 0:
+            return {'production': self.start_production, 'cost': self.start_cost}
+
+        step = int(np.searchsorted(self.production, target_amount))
+        if step == len(self):
+            return {'production': self.get_max_production(), 'cost': float(self.cost[-1])}
+
+        return {'production': float(target_amount),
+                'cost': float(self.base[step] + self.slope[step] * (target_amount - self.production_before[step]))}
+
+    def to_dict(self) -> dict:
+        """return the production and cost after every step, starting with the plan before the first step"""
+        return {'production': [self.start_production] + self.production.tolist(),
+                'cost': [self.start_cost] + self.cost.tolist()}
+
+
+# the cost curves of the last MAX_COST_CURVES years and reference data versions, least recently used first out
+MAX_COST_CURVES = 16
+_cost_curves: Dict[tuple, CostCurve] = OrderedDict()
+_cost_curves_lock = threading.Lock()
+
+
+def get_cached_cost_curve(year: int, reference_data_version: str) -> Optional[CostCurve]:
+    """return the cost curve built for a year and reference data version, None if it was not built yet"""
+    key = (year, reference_data_version)
+    with _cost_curves_lock:
+        cost_curve = _cost_curves.get(key)
+        if cost_curve is not None:
+            _cost_curves.move_to_end(key)
+
+        return cost_curve
+
+
+def cache_cost_curve(year: int, reference_data_version: str, cost_curve: CostCurve) -> None:
+    with _cost_curves_lock:
+        _cost_curves[(year, reference_data_version)] = cost_curve
+        _cost_curves.move_to_end((year, reference_data_version))
+        while len(_cost_curves) > MAX_COST_CURVES:
+            _cost_curves.popitem(last=False)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from planner.plan import MAX_NUMBER_OF_PUMPS
+
+
+class CostModel:
+    """
+    The production and cost of every number of pumps, as [month, taoz, facility, number of pumps] tables
+    built once from the reference data, so the planning stages index a table instead of looking up
+    the specific energy and pump range documents and multiplying them again for every hour.
+    the production amounts are per hour (a slot scales them by Plan.slot_hours), the costs are in agurot
+    and the 0 pumps column produces and costs nothing.
+    a number of pumps whose specific energy is 0 is not available to the milp engine and the local search,
+    is_available tells them apart.
+    """
+
+    def __init__(self, se_tables: np.ndarray, min_hp_table: np.ndarray, max_hp_table: np.ndarray,
+                 taoz_cost_table: np.ndarray):
+        """
+        se_tables is [facility, month, number of pumps], the hp tables [facility, number of pumps]
+        and taoz_cost_table [month, taoz] (see ReferenceData)
+        """
+        months, taoz_values = taoz_cost_table.shape
+        shape = (months, taoz_values) + max_hp_table.shape
+
+        # the production range of every number of pumps
+        self.min_production = np.broadcast_to(min_hp_table.astype(float), shape)
+        self.production = np.broadcast_to(max_hp_table.astype(float), shape)
+
+        self.se = np.broadcast_to(np.nan_to_num(np.moveaxis(se_tables, 1, 0))[:, np.newaxis], shape)
+        self.is_available = self.se > 0
+
+        # the cost of a cubic meter and of an hour at the max production of every number of pumps
+        self.unit_cost = self.se * taoz_cost_table[:, :, np.newaxis, np.newaxis] / 100
+        self.cost = self.unit_cost * self.production
+
+        # the cost of every cubic meter the next pump adds, inf for the last pump
+        self.marginal_cost = np.full(shape, np.inf)
+        added_production = np.diff(self.production, axis=-1)
+        np.divide(np.diff(self.cost, axis=-1), added_production, out=self.marginal_cost[..., :MAX_NUMBER_OF_PUMPS],
+                  where=added_production > 0)
+
+        # the cost of a cubic meter at the cheapest available number of pumps, inf when none is available
+        self.cheapest_unit_cost = np.where(self.is_available, self.unit_cost, np.inf)[..., 1:].min(axis=-1)
@@ -0,0 +1,184 @@
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from planner.bounds import get_limits
+from planner.plan import Plan, FACILITIES
+from planner.reference_data import ReferenceData
+
+# a move has to save more than this (agurot) to be kept, smaller savings are rounding
+MIN_SAVING = 1.0
+# production amounts closer than this (cubic meters) to a pump range bound are inside it
+EPSILON = 1e-6
+# the most expensive sources and cheapest destinations of a day every move is looked for between
+NEIGHBORHOOD_SIZE = 12
+
+
+def get_cell_costs(amounts: np.ndarray, unit_cost: np.ndarray, is_available: np.ndarray, lower: np.ndarray,
+                   upper: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    return the cheapest cost (agurot) of producing every amount in its facility slot and the number of pumps it takes.
+    unit_cost, is_available, lower and upper hold the cost of a cubic meter, availability and pump range of every
+    number of pumps (1 to 5) on their last axis (see CostModel), an amount no available number of pumps covers
+    costs inf. a 0 amount costs 0 with 0 pumps.
+    """
+    level_amounts = amounts[..., np.newaxis]
+    covers = is_available & (lower - EPSILON <= level_amounts) & (level_amounts <= upper + EPSILON)
+    level_costs = np.where(covers, unit_cost * level_amounts, np.inf)
+
+    is_zero = amounts <= EPSILON
+    costs = np.where(is_zero, 0.0, level_costs.min(axis=-1))
+    pumps = np.where(is_zero, 0, level_costs.argmin(axis=-1) + 1)
+
+    return costs, pumps
+
+
+class DayCells:
+    """The facility slots of a plan day as flat arrays, cell i is slot i // 2 of facility i % 2."""
+
+    def __init__(self, matrix: Plan, reference_data: ReferenceData, day: int):
+        cols = matrix.shape[1]
+        cost_model = reference_data.cost_model
+
+        self.facility = np.tile(np.arange(len(FACILITIES)), cols)
+        self.slot = np.repeat(np.arange(cols), len(FACILITIES))
+        self.working = ~matrix.shutdown[day].ravel()
+        # the cost model rows of the cells, number of pumps 1 to 5
+        cost_index = (matrix.calendar.month[day], np.repeat(matrix.taoz[day], len(FACILITIES)), self.facility)
+        self.se = cost_model.se[cost_index][:, 1:]
+        self.unit_cost = cost_model.unit_cost[cost_index][:, 1:]
+        self.is_available = cost_model.is_available[cost_index][:, 1:]
+        self.lower = cost_model.min_production[cost_index][:, 1:] * matrix.slot_hours
+        self.upper = cost_model.production[cost_index][:, 1:] * matrix.slot_hours
+        # the amounts a facility slot can be moved to without leaving a pump range, 0 included
+        self.bounds = np.concatenate([np.zeros((len(self.slot), 1)), self.lower, self.upper], axis=1)
+        self.cheapest_unit_cost = cost_model.cheapest_unit_cost[cost_index]
+
+    def get_costs(self, cells: np.ndarray, amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """return the cost and number of pumps of amounts, shaped [cells, ...], in their cells"""
+        extra_axes = (np.newaxis,) * (amounts.ndim - 1)
+        index = (cells,) + extra_axes
+
+        return get_cell_costs(amounts, self.unit_cost[index], self.is_available[index], self.lower[index],
+                              self.upper[index])
+
+
+def find_best_move(matrix: Plan, cells: DayCells, day: int, hourly_min: float, hourly_max: float) \
+        -> Tuple[Optional[Tuple[float, int, int, float]], int]:
+    """
+    return the move of the day saving the most, as (saving, source cell, destination cell, moved amount),
+    or None when no move saves more than MIN_SAVING, with the number of (source, destination, amount) options looked at.
+    a move takes production from a facility slot and adds it to another facility slot of the same day, another
+    slot (from a PISGA hour to a SHEFEL hour for example) or the other facility of the same slot, so the daily,
+    bio month and yearly production stay as they are and only the hourly limits of the two slots are checked.
+    the moved amounts tried take the source or the destination to a bound of a pump range, or fill the room left.
+    """
+    amount = matrix.production_amount[day].ravel()
+    price = matrix.production_price[day].ravel()
+    slot_amount = matrix.production_amount[day].sum(axis=1)
+
+    unit_cost = np.divide(price, amount, out=np.zeros_like(price), where=amount > EPSILON)
+    sources = np.flatnonzero(cells.working & (amount > EPSILON))
+    sources = sources[np.argsort(-unit_cost[sources], kind='stable')[:NEIGHBORHOOD_SIZE]]
+    destinations = np.flatnonzero(cells.working & np.isfinite(cells.cheapest_unit_cost)
+                                  & (amount < cells.upper.max(axis=1) - EPSILON))
+    destinations = destinations[np.argsort(cells.cheapest_unit_cost[destinations], kind='stable')[:NEIGHBORHOOD_SIZE]]
+    if len(sources) == 0 or len(destinations) == 0:
+        return None, 0
+
+    # the room the hourly limits leave, a move inside a slot does not change the slot production
+    source_slot = cells.slot[sources][:, np.newaxis]
+    destination_slot = cells.slot[destinations][np.newaxis, :]
+    same_slot = source_slot == destination_slot
+    room = np.where(same_slot, np.inf, np.minimum(hourly_max - slot_amount[destination_slot],
+                                                  slot_amount[source_slot] - hourly_min))
+    room = np.minimum(room, amount[sources][:, np.newaxis])
+
+    source_moves = amount[sources][:, np.newaxis] - cells.bounds[sources]
+    destination_moves = cells.bounds[destinations][:, 1:] - amount[destinations][:, np.newaxis]
+    moved = np.concatenate([np.broadcast_to(source_moves[:, np.newaxis], (len(sources), len(destinations),
+                                                                           source_moves.shape[1])),
+                            np.broadcast_to(destination_moves[np.newaxis], (len(sources), len(destinations),
+                                                                             destination_moves.shape[1]))], axis=2)
+    moved = np.minimum(moved, room[..., np.newaxis])
+
+    source_costs, _ = cells.get_costs(sources, amount[sources][:, np.newaxis, np.newaxis] - moved)
+    destination_costs, _ = cells.get_costs(destinations,
+                                           np.moveaxis(amount[destinations][np.newaxis, :, np.newaxis] + moved, 1, 0))
+    savings = price[sources][:, np.newaxis, np.newaxis] + price[destinations][np.newaxis, :, np.newaxis] \
+        - source_costs - np.moveaxis(destination_costs, 0, 1)
+
+    is_option = (moved > EPSILON) & (sources[:, np.newaxis] != destinations[np.newaxis, :])[..., np.newaxis]
+    savings = np.where(is_option & np.isfinite(savings), savings, -np.inf)
+
+    best = np.unravel_index(np.argmax(savings), savings.shape)
+    if savings[best] <= MIN_SAVING:
+        return None, savings.size
+
+    source, destination, _ = best
+    return (float(savings[best]), int(sources[source]), int(destinations[destination]), float(moved[best])), \
+        savings.size
+
+
+def apply_move(matrix: Plan, cells: DayCells, day: int, source: int, destination: int, moved: float) -> None:
+    """moves production between two facility slots of a day, each gets the cheapest number of pumps for its amount"""
+    for cell, added_amount in ((source, -moved), (destination, moved)):
+        hour, facility = divmod(cell, len(FACILITIES))
+        new_amount = matrix.production_amount[day, hour, facility] + added_amount
+        _, pumps = cells.get_costs(np.array([cell]), np.array([new_amount]))
+        pumps = int(pumps[0])
+
+        matrix.save_slot(day, hour)
+        matrix.number_of_pumps[day, hour, facility] = pumps
+        matrix.se_per_hour[day, hour, facility] = cells.se[cell, pumps - 1] if pumps else 0
+        matrix.set_production_amount(day, hour, facility, new_amount)
+        matrix.calculate_hour_price(day, hour)
+
+
+def improve_local_search(matrix: Plan, reference_data: ReferenceData, deadline: float = None) -> dict:
+    """
+    moves production between the facility slots of every day while a move makes the plan cheaper (see find_best_move),
+    until no move is left or the deadline (time.monotonic() time) passes. the move saving the most is applied first,
+    every move is tried on the plan (see Plan.begin_move) and kept only when the plan cost really falls.
+    the production of every day, bio month and year is kept and no hourly max limit is broken by a move.
+    return the moves made, the cost saved and the status, 'converged' or 'deadline'.
+    """
+    production_limits = reference_data.production_limits
+    bio_months = matrix.calendar.bio_month
+    hourly_min = get_limits(production_limits, 'hourly', 'min')[bio_months] * matrix.slot_hours
+    hourly_max = get_limits(production_limits, 'hourly', 'max')[bio_months] * matrix.slot_hours
+
+    moves = 0
+    saved = 0.0
+    is_deadline = False
+    for day in range(len(matrix)):
+        cells = DayCells(matrix, reference_data, day)
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                is_deadline = True
+                break
+
+            move, options = find_best_move(matrix, cells, day, hourly_min[day], hourly_max[day])
+            matrix.metrics['local_search_cells_scanned'] += options
+            if move is None:
+                break
+
+            _, source, destination, moved = move
+            with matrix.begin_move() as plan_move:
+                apply_move(matrix, cells, day, source, destination, moved)
+                cost_delta = plan_move.get_cost_delta()
+                if cost_delta < -MIN_SAVING:
+                    plan_move.commit()
+            if cost_delta >= -MIN_SAVING:
+                break
+
+            moves += 1
+            saved -= cost_delta
+            matrix.metrics['local_search_selections'] += 1
+            matrix.metrics['local_search_saved_cost'] -= cost_delta
+
+        if is_deadline:
+            break
+
+    return {'moves': moves, 'saved': saved, 'status': 'deadline' if is_deadline else 'converged'}
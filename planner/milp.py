@@ -0,0 +1,232 @@
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from planner.calendar_index import BIO_MONTHS
+from planner.plan import Plan, FACILITIES, MAX_NUMBER_OF_PUMPS
+
+
+def group_rows(groups: np.ndarray, columns: np.ndarray, values: np.ndarray, number_of_groups: int) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    return the row wise (starts, indices, values) of constraint rows summing columns by group,
+    row i sums every column whose group is i.
+    """
+    order = np.argsort(groups, kind='stable')
+    starts = np.searchsorted(groups[order], np.arange(number_of_groups))
+
+    return starts, columns[order], values[order]
+
+
+def add_rows(h, lower: np.ndarray, upper: np.ndarray, starts: np.ndarray, indices: np.ndarray,
+             values: np.ndarray) -> None:
+    """adds the row wise (starts, indices, values) constraint rows to the model"""
+    h.addRows(len(lower), lower, upper, len(indices),
+              starts.astype(np.int32), indices.astype(np.int32), values.astype(float))
+
+
+def run(h, deadline: float) -> None:
+    """runs the solver with the time left until deadline (time.monotonic seconds)"""
+    h.setOptionValue('time_limit', max(deadline - time.monotonic(), 0.0))
+    h.run()
+
+
+def plan_milp(matrix: Plan, production_limits, target_amount: int, se_tables: np.ndarray, min_hp_table: np.ndarray,
+              max_hp_table: np.ndarray, time_limit: float, warm_start: Plan = None, mip_gap: float = 1e-4) -> dict:
+    """
+    finds the cheapest plan reaching target_amount with the HiGHS MILP solver and writes it into matrix.
+    every working facility hour chooses a number of pumps (or none) and a production amount inside the
+    min/max range of that number of pumps, priced with the specific energy of that number of pumps in its month.
+    the hourly (per slot), daily and bio monthly limits are hard constraints, a number of pumps whose specific energy is 0
+    is treated as unavailable.
+    warm_start (usually the greedy plan) is repaired into a first solution for the solver,
+    time_limit (seconds) covers the repair and the solve. when the solver stops before it finds a plan of its own,
+    the repaired warm start is the plan and warm_start is set in the result.
+    return the solver status, plan cost, best bound and gap (None when the solver has none),
+    matrix is left untouched if no plan was found.
+    """
+    try:
+        import highspy
+    except ImportError:
+        raise RuntimeError("the 'milp' engine needs the highspy package (pip install highspy)")
+
+    rows, cols = matrix.shape
+    months = matrix.calendar.month
+    bio_months = matrix.calendar.bio_month
+
+    # a (day, hour, facility, number of pumps) option for every working facility hour
+    day, hour, facility, pumps = np.meshgrid(np.arange(rows), np.arange(cols), np.arange(len(FACILITIES)),
+                                             np.arange(1, MAX_NUMBER_OF_PUMPS + 1), indexing='ij')
+    se_per_hour = se_tables[facility, months[day], pumps]
+    is_option = ~matrix.shutdown[day, hour, facility] & (se_per_hour > 0)
+
+    day, hour, facility, pumps, se_per_hour = (field[is_option] for field in (day, hour, facility, pumps, se_per_hour))
+    options = len(day)
+
+    # columns 0..options-1 are the production amounts, columns options..2*options-1 the pumps binaries
+    production_columns = np.arange(options)
+    pumps_columns = production_columns + options
+    cost = se_per_hour * matrix.taoz_cost[day, hour, facility] / 100
+
+    inf = highspy.kHighsInf
+    feasible = highspy.SolutionStatus.kSolutionStatusFeasible
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    deadline = time.monotonic() + time_limit
+    h.setOptionValue('mip_rel_gap', mip_gap)
+
+    h.addCols(2 * options,
+              np.concatenate([cost, np.zeros(options)]),
+              np.zeros(2 * options),
+              np.concatenate([max_hp_table[facility, pumps].astype(float), np.ones(options)]),
+              0, np.zeros(2 * options, dtype=np.int32), np.array([], dtype=np.int32), np.array([]))
+
+    pumps_columns_32 = pumps_columns.astype(np.int32)
+    integrality = np.full(options, highspy.HighsVarType.kInteger.value, dtype=np.uint8)
+    h.changeColsIntegrality(options, pumps_columns_32, integrality)
+
+    row_blocks: List[Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]] = []
+
+    # min/max production of the chosen number of pumps, production is 0 when the option is not chosen
+    link_columns = np.stack([production_columns, pumps_columns], axis=1).ravel()
+    link_starts = np.arange(options) * 2
+    row_blocks.append((np.full(options, -inf), np.zeros(options),
+                       (link_starts, link_columns, np.stack([np.ones(options), -max_hp_table[facility, pumps]], axis=1).ravel())))
+    row_blocks.append((np.zeros(options), np.full(options, inf),
+                       (link_starts, link_columns, np.stack([np.ones(options), -min_hp_table[facility, pumps]], axis=1).ravel())))
+
+    # a single number of pumps for every facility hour
+    facility_hours = rows * cols * len(FACILITIES)
+    facility_hour = (day * cols + hour) * len(FACILITIES) + facility
+    row_blocks.append((np.full(facility_hours, -inf), np.ones(facility_hours),
+                       group_rows(facility_hour, pumps_columns, np.ones(options), facility_hours)))
+
+    limits = [production_limits[bio_month] for bio_month in BIO_MONTHS]
+
+    # the production limits as (lower, upper, row of every option, number of rows) blocks
+    limit_blocks = []
+    hourly_min = np.array([limit['hourly']['min'] for limit in limits])[bio_months] * matrix.slot_hours
+    hourly_max = np.array([limit['hourly']['max'] for limit in limits])[bio_months] * matrix.slot_hours
+    limit_blocks.append((np.repeat(hourly_min, cols).astype(float), np.repeat(hourly_max, cols).astype(float),
+                         day * cols + hour, rows * cols))
+
+    daily_min = np.array([limit['daily']['min'] for limit in limits])[bio_months]
+    daily_max = np.array([limit['daily']['max'] for limit in limits])[bio_months]
+    limit_blocks.append((daily_min.astype(float), daily_max.astype(float), day, rows))
+
+    # bio months that are not in the plan keep empty, unbounded rows
+    in_plan = matrix.calendar.bio_month_start != -1
+    coverage = matrix.calendar.bio_month_coverage
+    bio_month_min = np.where(in_plan, np.array([limit['biomonthly']['min'] for limit in limits]) * coverage, -inf)
+    bio_month_max = np.where(in_plan, np.array([limit['biomonthly']['max'] for limit in limits]) * coverage, inf)
+    limit_blocks.append((bio_month_min, bio_month_max, bio_months[day], len(BIO_MONTHS)))
+
+    limit_blocks.append((np.array([float(target_amount)]), np.array([inf]), np.zeros(options, dtype=int), 1))
+
+    for lower, upper, groups, number_of_groups in limit_blocks:
+        row_blocks.append((lower, upper, group_rows(groups, production_columns, np.ones(options), number_of_groups)))
+
+    for lower, upper, (starts, indices, values) in row_blocks:
+        add_rows(h, lower, upper, starts, indices, values)
+
+    def solve_fixed_pumps(is_chosen: np.ndarray) -> Optional[np.ndarray]:
+        """
+        solves the production amounts with the chosen options fixed, return the column values of the model or None.
+        the LP only has the production columns of the chosen options, solving it in the whole model is much slower.
+        """
+        chosen = np.flatnonzero(is_chosen)
+        lp = highspy.Highs()
+        lp.setOptionValue('output_flag', False)
+        lp.addCols(len(chosen), cost[chosen], min_hp_table[facility[chosen], pumps[chosen]].astype(float),
+                   max_hp_table[facility[chosen], pumps[chosen]].astype(float),
+                   0, np.zeros(len(chosen), dtype=np.int32), np.array([], dtype=np.int32), np.array([]))
+        for lower, upper, groups, number_of_groups in limit_blocks:
+            add_rows(lp, lower, upper,
+                     *group_rows(groups[chosen], np.arange(len(chosen)), np.ones(len(chosen)), number_of_groups))
+        run(lp, deadline)
+        if lp.getInfo().primal_solution_status != feasible:
+            return None
+
+        col_value = np.zeros(2 * options)
+        col_value[production_columns[chosen]] = lp.getSolution().col_value
+        col_value[pumps_columns[chosen]] = 1
+
+        return col_value
+
+    start_solution = None
+    if warm_start is not None:
+        # the greedy numbers of pumps are fixed, rounded up to the closest option, and the production amounts
+        # are solved as an LP, which is at least as cheap as the greedy plan whenever it keeps to the limits
+        pumps_difference = pumps - warm_start.number_of_pumps[day, hour, facility]
+        distance = np.where(pumps_difference >= 0, pumps_difference, MAX_NUMBER_OF_PUMPS - pumps_difference)
+        closest = np.full(facility_hours, np.iinfo(np.int64).max)
+        np.minimum.at(closest, facility_hour, distance)
+        working = warm_start.number_of_pumps[day, hour, facility] > 0
+        start_solution = solve_fixed_pumps(working & (distance == closest[facility_hour]))
+
+        if start_solution is None:
+            # the greedy plan can break the pump ranges (a number of pumps with specific energy 0 or a production
+            # above its maximum) beyond repair, then the LP relaxation is rounded instead: every facility hour
+            # gets the smallest number of pumps that covers its relaxed production
+            h.changeColsIntegrality(options, pumps_columns_32,
+                                    np.full(options, highspy.HighsVarType.kContinuous.value, dtype=np.uint8))
+            run(h, deadline)
+            if h.getInfo().primal_solution_status == feasible:
+                facility_hour_amount = np.zeros(facility_hours)
+                np.add.at(facility_hour_amount, facility_hour, np.array(h.getSolution().col_value)[production_columns])
+
+                amount = facility_hour_amount[facility_hour]
+                covers = (max_hp_table[facility, pumps] >= amount - 1e-6) & (amount > 1e-6)
+                smallest = np.full(facility_hours, MAX_NUMBER_OF_PUMPS + 1)
+                np.minimum.at(smallest, facility_hour[covers], pumps[covers])
+                start_solution = solve_fixed_pumps(covers & (pumps == smallest[facility_hour]))
+            h.changeColsIntegrality(options, pumps_columns_32, integrality)
+
+        h.clearSolver()
+        if start_solution is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = start_solution.tolist()
+            solution.value_valid = True
+            h.setSolution(solution)
+
+    run(h, deadline)
+
+    info = h.getInfo()
+    result = {
+        'status': h.modelStatusToString(h.getModelStatus()),
+        'cost': None,
+        'bound': info.mip_dual_bound if np.isfinite(info.mip_dual_bound) else None,
+        'gap': info.mip_gap if np.isfinite(info.mip_gap) else None,
+        'warm_start': False,
+    }
+
+    if info.primal_solution_status == feasible:
+        values = np.array(h.getSolution().col_value)
+        result['cost'] = info.objective_function_value
+    elif start_solution is not None:
+        # the solver ran out of time before its first plan, the repaired warm start is a plan that keeps the limits
+        values = start_solution
+        result['cost'] = float(values[production_columns] @ cost)
+        result['warm_start'] = True
+        if result['bound'] is not None and result['cost'] > 0:
+            result['gap'] = (result['cost'] - result['bound']) / result['cost']
+    else:
+        return result
+
+    is_chosen = values[pumps_columns] > 0.5
+
+    working = ~matrix.shutdown
+    matrix.number_of_pumps[working] = 0
+    matrix.production_amount[working] = 0
+    matrix.se_per_hour[working] = 0
+
+    chosen = (day[is_chosen], hour[is_chosen], facility[is_chosen])
+    matrix.number_of_pumps[chosen] = pumps[is_chosen]
+    matrix.production_amount[chosen] = values[production_columns][is_chosen]
+    matrix.se_per_hour[chosen] = se_per_hour[is_chosen]
+
+    matrix.calculate_price()
+    matrix.refresh_totals()
+
+    return result
@@ -0,0 +1,383 @@
+from collections import Counter
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from planner.calendar_index import BIO_MONTHS, SEASONS, CalendarIndex
+from planner.classes import TAOZ_BY_CODE, Facility, MatrixBullet, Taoz
+
+NORTH = 0
+SOUTH = 1
+FACILITIES = ('north', 'south')
+MAX_NUMBER_OF_PUMPS = 5
+MINUTES_PER_DAY = 24 * 60
+
+FACILITY_FIELDS = ('production_amount', 'number_of_pumps', 'se_per_hour', 'taoz_cost', 'secondary_taoz_cost',
+                   'kwh_energy_limit', 'water_cubic_meter_price', 'shutdown', 'production_price')
+HOUR_FIELDS = ('taoz', 'price')
+TOTAL_FIELDS = ('daily_production_amount', 'bio_month_production_amount', 'yearly_production_amount')
+
+
+class Plan:
+    """
+    Columnar storage of a production plan.
+    every field is a numpy array shaped [days, hours, facility] (facility 0 is north, 1 is south),
+    except taoz and price which are per hour and shaped [days, hours].
+    the daily, bio monthly and yearly production totals are kept per [facility, taoz] and updated
+    on every set_production_amount call, so reading them never scans the grid.
+    a day is split into cols slots of slot_minutes, 24 hourly slots by default, production amounts are per slot.
+    """
+
+    def __init__(self, calendar: CalendarIndex, cols: int):
+        rows = len(calendar)
+        shape = (rows, cols, len(FACILITIES))
+
+        self.calendar = calendar
+        self.dates: List[date] = calendar.dates
+        self.slot_minutes = MINUTES_PER_DAY // cols
+        # the share of an hour every slot takes, the hourly production amounts of the reference data scale by it
+        self.slot_hours = self.slot_minutes / 60
+
+        self.production_amount = np.zeros(shape)
+        self.number_of_pumps = np.zeros(shape, dtype=np.int64)
+        self.se_per_hour = np.zeros(shape)
+        self.taoz_cost = np.zeros(shape)
+        self.secondary_taoz_cost = np.zeros(shape)
+        self.kwh_energy_limit = np.zeros(shape)
+        self.water_cubic_meter_price = np.zeros(shape)
+        self.shutdown = np.zeros(shape, dtype=bool)
+        # set when the shutdown dates were applied to the plan (see fill_matrix), replan keeps to it
+        self.apply_shutdown_dates = False
+        self.production_price = np.zeros(shape)
+
+        self.taoz = np.zeros((rows, cols), dtype=np.int8)
+        self.price = np.zeros((rows, cols))
+
+        self.daily_production_amount = np.zeros((rows, len(FACILITIES), len(Taoz)))
+        self.bio_month_production_amount = np.zeros((len(BIO_MONTHS), len(FACILITIES), len(Taoz)))
+        self.yearly_production_amount = np.zeros((len(FACILITIES), len(Taoz)))
+
+        # the solver status, cost, bound and gap of a plan solved by the milp engine
+        self.solver_result: Optional[dict] = None
+        # counters of the work the planning stages and the export did, like selections and scanned cells
+        self.metrics: Counter = Counter()
+        # the open move (see begin_move), every change to a slot is journaled in it
+        self.move: Optional[PlanMove] = None
+
+    @property
+    def shape(self):
+        return self.price.shape
+
+    def __len__(self) -> int:
+        return self.price.shape[0]
+
+    def __getitem__(self, key):
+        """plan[day, hour] returns a single MatrixBullet view, plan[day] returns the day as a list of views."""
+        if isinstance(key, tuple):
+            day, hour = key
+            return MatrixBulletView(self, day, hour)
+
+        return [MatrixBulletView(self, key, hour) for hour in range(self.shape[1])]
+
+    def __iter__(self):
+        for day in range(len(self)):
+            yield self[day]
+
+    def get_production_amount(self) -> float:
+        return self.yearly_production_amount.sum()
+
+    def get_daily_production_amount(self, day: int) -> float:
+        return self.daily_production_amount[day].sum()
+
+    def get_bio_month_production_amount(self, bio_month: int) -> float:
+        return self.bio_month_production_amount[bio_month].sum()
+
+    def save_slot(self, day: int, hour: int) -> None:
+        """journals the slot in the open move before it changes, code writing the plan arrays directly calls it first"""
+        if self.move is not None:
+            self.move.save(day, hour)
+
+    def set_production_amount(self, day: int, hour: int, facility: int, production_amount: float) -> None:
+        """sets the production amount of a single facility and updates the running totals"""
+        self.save_slot(day, hour)
+        added_amount = production_amount - self.production_amount[day, hour, facility]
+        self.production_amount[day, hour, facility] = production_amount
+
+        taoz = self.taoz[day, hour]
+        self.daily_production_amount[day, facility, taoz] += added_amount
+        self.bio_month_production_amount[self.calendar.bio_month[day], facility, taoz] += added_amount
+        self.yearly_production_amount[facility, taoz] += added_amount
+
+    def set_taoz(self, day: int, hour: int, taoz: int) -> None:
+        """sets the taoz of an hour and moves its production to the new taoz in the running totals"""
+        self.save_slot(day, hour)
+        production_amount = self.production_amount[day, hour]
+        bio_month = self.calendar.bio_month[day]
+
+        for totals, index in ((self.daily_production_amount, day),
+                              (self.bio_month_production_amount, bio_month),
+                              (self.yearly_production_amount, ...)):
+            totals[index][:, self.taoz[day, hour]] -= production_amount
+            totals[index][:, taoz] += production_amount
+
+        self.taoz[day, hour] = taoz
+
+    def copy(self) -> 'Plan':
+        """
+        return a copy of the whole plan, the arrays and running totals are copied as they are and the calendar
+        is shared, so it is cheaper than get_days over all the days. the metrics and solver result are not copied.
+        """
+        plan = Plan.__new__(Plan)
+        plan.__dict__.update(self.__dict__)
+        for field in FACILITY_FIELDS + HOUR_FIELDS + TOTAL_FIELDS:
+            setattr(plan, field, getattr(self, field).copy())
+        plan.solver_result = None
+        plan.metrics = Counter()
+        plan.move = None
+
+        return plan
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """return a copy of the plan state, the arrays the planning stages change, to restore it later"""
+        return {field: getattr(self, field).copy() for field in FACILITY_FIELDS + HOUR_FIELDS + TOTAL_FIELDS}
+
+    def restore(self, snapshot: Dict[str, np.ndarray]) -> None:
+        """brings the plan back to a state returned by snapshot, the snapshot can be restored again"""
+        for field, values in snapshot.items():
+            getattr(self, field)[:] = values
+
+    def begin_move(self) -> 'PlanMove':
+        """
+        opens a move, the slots changed from now on are journaled until the move is committed or rolled back.
+        a move only copies the slots it changes, so trying a move and rolling it back costs as much as the move.
+        """
+        if self.move is not None:
+            raise RuntimeError('a move is already open on the plan')
+
+        self.move = PlanMove(self)
+        return self.move
+
+    def get_days(self, start: int, end: int) -> 'Plan':
+        """return a copy of the days start to end (inclusive) as a plan of its own, with its own totals"""
+        plan = Plan(self.calendar.get_days(start, end), self.shape[1])
+        plan.apply_shutdown_dates = self.apply_shutdown_dates
+        for field in FACILITY_FIELDS + HOUR_FIELDS:
+            getattr(plan, field)[:] = getattr(self, field)[start:end + 1]
+        plan.refresh_totals()
+
+        return plan
+
+    def set_days(self, start: int, plan: 'Plan') -> None:
+        """writes a plan returned by get_days back into this plan, starting at day start"""
+        end = start + len(plan)
+        for field in FACILITY_FIELDS + HOUR_FIELDS:
+            getattr(self, field)[start:end] = getattr(plan, field)
+        self.refresh_totals()
+
+    def refresh_totals(self) -> None:
+        """rebuilds the running totals from the whole grid, used after bulk changes of production_amount or taoz"""
+        self.daily_production_amount[:] = 0
+        for taoz in Taoz:
+            is_taoz = (self.taoz == taoz.value)[..., np.newaxis]
+            self.daily_production_amount[..., taoz.value] = np.where(is_taoz, self.production_amount, 0).sum(axis=1)
+
+        self.bio_month_production_amount[:] = 0
+        np.add.at(self.bio_month_production_amount, self.calendar.bio_month, self.daily_production_amount)
+        self.yearly_production_amount[:] = self.bio_month_production_amount.sum(axis=0)
+
+    def calculate_price(self) -> None:
+        """calculates the production price of every facility and the price of every hour, in agurot."""
+        self.production_price = np.where(self.shutdown,
+                                         self.production_price,
+                                         self.se_per_hour * self.production_amount * self.taoz_cost / 100)
+        self.price = self.production_price.sum(axis=2)
+
+    def calculate_facility_price(self, day: int, hour: int, facility: int) -> None:
+        """calculates the production price of a single facility, the hour price is left untouched."""
+        if not self.shutdown[day, hour, facility]:
+            self.save_slot(day, hour)
+            self.production_price[day, hour, facility] = self.se_per_hour[day, hour, facility] \
+                * self.production_amount[day, hour, facility] * self.taoz_cost[day, hour, facility] / 100
+
+    def calculate_hour_price(self, day: int, hour: int) -> None:
+        """calculates the price of both facilities of an hour and sums it into the hour price."""
+        for facility in range(len(FACILITIES)):
+            self.calculate_facility_price(day, hour, facility)
+        self.save_slot(day, hour)
+        self.price[day, hour] = self.production_price[day, hour].sum()
+
+
+class PlanMove:
+    """
+    A journal of the slots a change to a Plan touches, returned by Plan.begin_move.
+    used as a context manager a move is rolled back unless it was committed inside the block:
+
+        with matrix.begin_move() as move:
+            update_hour(matrix, reference_data, day, hour, True, hourly_limit)
+            if move.get_cost_delta() < 0:
+                move.commit()
+    """
+
+    def __init__(self, plan: Plan):
+        self.plan = plan
+        # the facility and hour fields of every changed slot and the running totals, as they were before the move
+        self.saved_slots: Dict[tuple, tuple] = {}
+        self.saved_daily_totals: Dict[int, np.ndarray] = {}
+        self.saved_totals: Optional[tuple] = None
+
+    def __enter__(self) -> 'PlanMove':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.plan.move is self:
+            self.rollback()
+
+    def save(self, day: int, hour: int) -> None:
+        slot = (day, hour)
+        if slot in self.saved_slots:
+            return
+
+        plan = self.plan
+        self.saved_slots[slot] = tuple(getattr(plan, field)[slot].copy() for field in FACILITY_FIELDS + HOUR_FIELDS)
+        if day not in self.saved_daily_totals:
+            self.saved_daily_totals[day] = plan.daily_production_amount[day].copy()
+        if self.saved_totals is None:
+            self.saved_totals = (plan.bio_month_production_amount.copy(), plan.yearly_production_amount.copy())
+
+    def get_cost_delta(self) -> float:
+        """the change of the plan cost (sum of the hour prices) since the move began"""
+        price_index = len(FACILITY_FIELDS) + HOUR_FIELDS.index('price')
+        return sum(float(self.plan.price[slot] - saved[price_index]) for slot, saved in self.saved_slots.items())
+
+    def get_production_delta(self) -> float:
+        """the change of the plan production amount since the move began"""
+        production_index = FACILITY_FIELDS.index('production_amount')
+        return sum(float((self.plan.production_amount[slot] - saved[production_index]).sum())
+                   for slot, saved in self.saved_slots.items())
+
+    def commit(self) -> None:
+        """keeps the changes and closes the move"""
+        self.close()
+
+    def rollback(self) -> None:
+        """brings every changed slot and the running totals back to their state before the move and closes it"""
+        plan = self.plan
+        for slot, saved in self.saved_slots.items():
+            for field, values in zip(FACILITY_FIELDS + HOUR_FIELDS, saved):
+                getattr(plan, field)[slot] = values
+
+        # the totals are restored as they were, so a rolled back move leaves no rounding drift behind
+        for day, daily_totals in self.saved_daily_totals.items():
+            plan.daily_production_amount[day] = daily_totals
+        if self.saved_totals is not None:
+            plan.bio_month_production_amount[:], plan.yearly_production_amount[:] = self.saved_totals
+
+        self.close()
+
+    def close(self) -> None:
+        self.saved_slots.clear()
+        self.saved_daily_totals.clear()
+        self.saved_totals = None
+        self.plan.move = None
+
+
+class FacilityView(Facility):
+    """A Facility backed by a (day, hour, facility) cell of a Plan."""
+
+    __slots__ = ('_plan', '_index')
+
+    def __init__(self, plan: Plan, day: int, hour: int, facility: int):
+        self._plan = plan
+        self._index = (day, hour, facility)
+
+    def __eq__(self, other):
+        return isinstance(other, FacilityView) and self._plan is other._plan and self._index == other._index
+
+    def __hash__(self):
+        return hash(self._index)
+
+
+def _facility_field(name: str) -> property:
+    def getter(self):
+        return getattr(self._plan, name)[self._index].item()
+
+    def setter(self, value):
+        if name == 'production_amount':
+            self._plan.set_production_amount(*self._index, value)
+        else:
+            self._plan.save_slot(*self._index[:2])
+            getattr(self._plan, name)[self._index] = value
+
+    return property(getter, setter)
+
+
+for _field in FACILITY_FIELDS:
+    setattr(FacilityView, _field, _facility_field(_field))
+
+
+class MatrixBulletView(MatrixBullet):
+    """A MatrixBullet backed by a (day, hour) cell of a Plan, keeps the MatrixBullet API for old callers."""
+
+    __slots__ = ('_plan', 'day', 'hour')
+
+    def __init__(self, plan: Plan, day: int, hour: int):
+        self._plan = plan
+        self.day = day
+        self.hour = hour
+
+    @property
+    def north_facility(self) -> FacilityView:
+        return FacilityView(self._plan, self.day, self.hour, NORTH)
+
+    @property
+    def south_facility(self) -> FacilityView:
+        return FacilityView(self._plan, self.day, self.hour, SOUTH)
+
+    @property
+    def taoz(self) -> Taoz:
+        return TAOZ_BY_CODE[self._plan.taoz[self.day, self.hour]]
+
+    @taoz.setter
+    def taoz(self, value: Taoz) -> None:
+        self._plan.set_taoz(self.day, self.hour, value.value)
+
+    @property
+    def taoz_code(self) -> int:
+        return int(self._plan.taoz[self.day, self.hour])
+
+    @taoz_code.setter
+    def taoz_code(self, value: int) -> None:
+        self._plan.set_taoz(self.day, self.hour, value)
+
+    @property
+    def date(self) -> date:
+        return self._plan.dates[self.day]
+
+    @property
+    def price(self) -> float:
+        return self._plan.price[self.day, self.hour].item()
+
+    @price.setter
+    def price(self, value: float) -> None:
+        self._plan.save_slot(self.day, self.hour)
+        self._plan.price[self.day, self.hour] = value
+
+    def get_production_amount(self) -> float:
+        return self._plan.production_amount[self.day, self.hour].sum().item()
+
+    def get_week_day(self) -> int:
+        return int(self._plan.calendar.week_day[self.day])
+
+    def get_season(self) -> str:
+        return SEASONS[self._plan.calendar.season[self.day]]
+
+    def get_bio_month(self) -> str:
+        return BIO_MONTHS[self._plan.calendar.bio_month[self.day]]
+
+    def __eq__(self, other):
+        return isinstance(other, MatrixBulletView) and self._plan is other._plan \
+            and (self.day, self.hour) == (other.day, other.hour)
+
+    def __hash__(self):
+        return hash((self.day, self.hour))
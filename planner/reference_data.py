@@ -0,0 +1,140 @@
+import copy
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from planner.calendar_index import MONTHS
+from planner.classes import Taoz
+from planner.cost_model import CostModel
+from planner.plan import FACILITIES, MAX_NUMBER_OF_PUMPS
+
+COLLECTIONS = ('taoz', 'taoz_cost_limit', 'min_max_hp', 'specific_energy', 'holidays', 'elections',
+               'production_limits', 'shutdown_dates')
+# the collections a scenario can override
+OVERRIDABLE_COLLECTIONS = ('production_limits', 'taoz_cost_limit', 'shutdown_dates')
+
+
+def merge_documents(document, override):
+    """
+    return document with override merged into it, dicts are merged key by key and any other value is replaced.
+    a list is replaced by a list override, a dict override merges into the list items at its keys, the item indices,
+    so {'taoz_cost': {'5': {'PISGA': 120}}} only changes the june PISGA cost of the 12 monthly taoz costs.
+    """
+    if isinstance(document, list) and isinstance(override, dict):
+        merged = list(document)
+        for index, value in override.items():
+            merged[int(index)] = merge_documents(document[int(index)], value)
+        return merged
+    if not isinstance(document, dict) or not isinstance(override, dict):
+        return copy.deepcopy(override)
+
+    merged = dict(document)
+    for key, value in override.items():
+        merged[key] = merge_documents(document.get(key), value)
+
+    return merged
+
+
+def get_se_table(facility_se) -> np.ndarray:
+    """
+    return the specific energy of a facility as a [month, number of pumps] table,
+    the 0 pumps column is nan since there is no 'e_0' key.
+    """
+    return np.array([[np.nan] + [month_se['e_' + str(pumps)] for pumps in range(1, MAX_NUMBER_OF_PUMPS + 1)]
+                     for month_se in facility_se])
+
+
+def get_monthly_taoz_table(monthly_values) -> np.ndarray:
+    """return a list of 12 monthly {taoz name: value} documents as a [month, taoz] table"""
+    return np.array([[month_values[taoz.name] for taoz in Taoz] for month_values in monthly_values])
+
+
+class ReferenceData:
+    """
+    The reference documents a plan is built from, one attribute for every collection in COLLECTIONS,
+    with the raw document content (no '_id').
+    the lookup tables derived from them are built once, so a ReferenceData should not be changed after it is created,
+    a document the tables cannot be built from, or that gives them a missing or negative value, raises ValueError.
+    """
+
+    def __init__(self, taoz, taoz_cost_limit, min_max_hp, specific_energy, holidays, elections, production_limits,
+                 shutdown_dates):
+        self.taoz = taoz
+        self.taoz_cost_limit = taoz_cost_limit
+        self.min_max_hp = min_max_hp
+        self.specific_energy = specific_energy
+        self.holidays = holidays
+        self.elections = elections
+        self.production_limits = production_limits
+        self.shutdown_dates = shutdown_dates
+
+        try:
+            # [facility, month, number of pumps]
+            self.se_tables = np.stack([get_se_table(specific_energy[facility_name]) for facility_name in FACILITIES])
+            # [facility, number of pumps], 0 pumps produce 0
+            self.min_hp_table = self.get_hp_table('min')
+            self.max_hp_table = self.get_hp_table('max')
+            # [month, taoz]
+            self.taoz_cost_table = get_monthly_taoz_table(taoz_cost_limit['taoz_cost'])
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(f'cannot build the reference tables, {type(error).__name__}: {error}') from error
+        self.validate_tables()
+        self.cost_model = CostModel(self.se_tables, self.min_hp_table, self.max_hp_table, self.taoz_cost_table)
+
+        self.version = hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True, default=str).encode()).hexdigest()
+
+    def validate_tables(self) -> None:
+        """raises ValueError when a derived table does not have its shape or holds a missing or negative value"""
+        expected_shapes = {
+            'se_tables': (len(FACILITIES), len(MONTHS), MAX_NUMBER_OF_PUMPS + 1),
+            'min_hp_table': (len(FACILITIES), MAX_NUMBER_OF_PUMPS + 1),
+            'max_hp_table': (len(FACILITIES), MAX_NUMBER_OF_PUMPS + 1),
+            'taoz_cost_table': (len(MONTHS), len(Taoz)),
+        }
+        for name, expected_shape in expected_shapes.items():
+            table = getattr(self, name)
+            if table.shape != expected_shape or not np.issubdtype(table.dtype, np.number):
+                raise ValueError(f'{name} should be a {expected_shape} numeric table, got {table.shape} {table.dtype}')
+            # the 0 pumps column of the specific energy is nan by design
+            values = table[..., 1:] if name == 'se_tables' else table
+            if not np.isfinite(values).all() or (values < 0).any():
+                raise ValueError(f'{name} holds a missing or negative value')
+
+        if (self.min_hp_table > self.max_hp_table).any():
+            raise ValueError('min_max_hp has a min production amount above its max')
+
+    def get_hp_table(self, bound: str) -> np.ndarray:
+        """return the 'min' or 'max' production amount as a [facility, number of pumps] table"""
+        return np.array([[0] + [hp[bound] for hp in self.min_max_hp[facility_name]] for facility_name in FACILITIES])
+
+    def to_dict(self) -> dict:
+        return {collection: getattr(self, collection) for collection in COLLECTIONS}
+
+    def with_overrides(self, overrides: dict) -> 'ReferenceData':
+        """
+        return a copy of the reference data with overrides ({collection: partial document}) merged in,
+        only the OVERRIDABLE_COLLECTIONS can be overridden.
+        """
+        unknown_collections = set(overrides) - set(OVERRIDABLE_COLLECTIONS)
+        if unknown_collections:
+            raise ValueError(f'cannot override {", ".join(sorted(unknown_collections))}')
+
+        documents = self.to_dict()
+        for collection, override in overrides.items():
+            documents[collection] = merge_documents(documents[collection], override)
+
+        return ReferenceData(**documents)
+
+
+def load_reference_data_directory(path: str) -> ReferenceData:
+    """reads the reference data from a directory of mongoexport json arrays named <collection>.json, like db/"""
+    documents = {}
+    for collection in COLLECTIONS:
+        with open(os.path.join(path, f'{collection}.json')) as collection_file:
+            document = json.load(collection_file)[0]
+        document.pop('_id', None)
+        documents[collection] = document
+
+    return ReferenceData(**documents)
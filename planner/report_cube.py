@@ -0,0 +1,60 @@
+from typing import Optional
+
+import numpy as np
+
+from planner.classes import Taoz
+from planner.plan import Plan
+
+METRICS = ('production_amount', 'number_of_pumps', 'se_per_hour', 'taoz_cost', 'secondary_taoz_cost',
+           'kwh_energy_limit', 'shutdown', 'production_price', 'energy_consumption')
+# metrics reported with their plan type instead of float
+METRIC_TYPES = {'number_of_pumps': int, 'shutdown': bool}
+
+
+class ReportCube:
+    """
+    Aggregates of a plan for reporting, computed once from the plan arrays.
+    values is shaped [days, hours, facility, metric] (metric indexes METRICS), daily holds the per day sums
+    shaped [days, facility, metric] and taoz_daily the per day sums of every taoz shaped [days, facility, taoz, metric].
+    the getters take facility None for the sum of both facilities.
+    """
+
+    def __init__(self, matrix: Plan):
+        self.dates = matrix.dates
+        self.taoz = matrix.taoz.copy()
+        self.hours = matrix.shape[1]
+        # the plan metrics, the report writers add what they wrote to them
+        self.metrics = matrix.metrics
+
+        plan_metrics = [getattr(matrix, metric) for metric in METRICS if metric != 'energy_consumption']
+        energy_consumption = matrix.production_amount * matrix.se_per_hour
+        self.values = np.stack(plan_metrics + [energy_consumption], axis=-1).astype(float)
+
+        is_taoz = self.taoz[..., np.newaxis] == np.arange(len(Taoz))
+        self.daily = self.values.sum(axis=1)
+        self.taoz_daily = np.einsum('dht,dhfm->dftm', is_taoz.astype(float), self.values)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def get_hours(self, metric: str, facility: Optional[int] = None) -> np.ndarray:
+        """return the metric of every [day, hour], in the plan type of the metric"""
+        values = self.values[..., METRICS.index(metric)]
+        values = values.sum(axis=2) if facility is None else values[..., facility]
+
+        return values.astype(METRIC_TYPES.get(metric, float))
+
+    def get_daily_sum(self, metric: str, facility: Optional[int] = None) -> np.ndarray:
+        daily = self.daily[..., METRICS.index(metric)]
+
+        return daily.sum(axis=1) if facility is None else daily[:, facility]
+
+    def get_taoz_daily_sums(self, metric: str, facility: Optional[int] = None) -> np.ndarray:
+        """return the daily sums of every taoz shaped [days, taoz], indexed by the taoz value"""
+        taoz_daily = self.taoz_daily[..., METRICS.index(metric)]
+
+        return taoz_daily.sum(axis=1) if facility is None else taoz_daily[:, facility]
+
+    def get_taoz_sums(self, metric: str, facility: Optional[int] = None) -> np.ndarray:
+        """return the yearly sum of every taoz, indexed by the taoz value"""
+        return self.get_taoz_daily_sums(metric, facility).sum(axis=0)
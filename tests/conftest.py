@@ -0,0 +1,16 @@
+import os
+
+import pytest
+
+from planner.reference_data import ReferenceData, load_reference_data_directory
+
+# importing the app needs a mongo uri, the client only connects on its first query
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/sorek')
+
+DB_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'db')
+
+
+@pytest.fixture(scope='session')
+def reference_data() -> ReferenceData:
+    """the reference documents shipped in db/"""
+    return load_reference_data_directory(DB_DIRECTORY)
@@ -0,0 +1,19 @@
+from datetime import date
+
+import pytest
+
+from planner.calendar_index import CalendarIndex
+
+
+def test_a_rolling_window_covers_part_of_its_bio_months(reference_data):
+    calendar = CalendarIndex(2021, reference_data.holidays, reference_data.elections, date(2021, 11, 1), 90)
+
+    assert calendar.bio_month_coverage.tolist() == pytest.approx([29 / 59, 0, 0, 0, 0, 1])
+    assert calendar.get_bio_month_days(5) == (0, 60)
+    assert calendar.get_bio_month_days(0) == (61, 89)
+
+
+@pytest.mark.parametrize('start, days', [(date(2021, 1, 1), 400), (date(2021, 2, 15), 365)])
+def test_a_horizon_covering_a_bio_month_twice_is_rejected(reference_data, start, days):
+    with pytest.raises(ValueError):
+        CalendarIndex(2021, reference_data.holidays, reference_data.elections, start, days)
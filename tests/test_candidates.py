@@ -0,0 +1,33 @@
+from planner.candidates import CandidateHeap
+
+CELLS = [(0, 0, 0), (0, 1, 0), (1, 0, 1)]
+
+
+def test_pops_the_lowest_key_first():
+    keys = {CELLS[0]: 3.0, CELLS[1]: 1.0, CELLS[2]: 2.0}
+    heap = CandidateHeap(keys.get, [(key, cell) for cell, key in keys.items()])
+
+    assert [heap.pop() for _ in CELLS] == [(1.0, CELLS[1]), (2.0, CELLS[2]), (3.0, CELLS[0])]
+    assert heap.pop() is None
+    assert heap.selections == 3
+
+
+def test_stale_entries_are_pushed_again_with_their_current_key():
+    keys = {CELLS[0]: 1.0, CELLS[1]: 2.0}
+    heap = CandidateHeap(keys.get, [(key, cell) for cell, key in keys.items()])
+    keys[CELLS[0]] = 5.0
+
+    assert heap.pop() == (2.0, CELLS[1])
+    assert heap.pop() == (5.0, CELLS[0])
+    assert heap.scanned == 3
+
+
+def test_cells_without_a_key_are_skipped():
+    keys = {CELLS[0]: 1.0, CELLS[1]: 2.0}
+    heap = CandidateHeap(keys.get, [(key, cell) for cell, key in keys.items()])
+    keys[CELLS[0]] = None
+    heap.push(CELLS[2])
+
+    assert heap.pop() == (2.0, CELLS[1])
+    assert heap.pop() is None
+    assert (heap.selections, heap.scanned) == (1, 2)
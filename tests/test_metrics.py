@@ -0,0 +1,34 @@
+import threading
+
+from app import app, routes
+
+PLAN = {'year': 2021, 'target': 151700000}
+
+
+def get_job_counts(client) -> dict:
+    lines = client.get('/metrics').get_data(as_text=True).splitlines()
+    return {line.split('"')[1]: float(line.split()[-1]) for line in lines if line.startswith('sorek_plan_jobs{')}
+
+
+def test_job_counts_drop_to_zero_when_jobs_finish(monkeypatch):
+    release = threading.Event()
+
+    def run_plan(job):
+        release.wait(10)
+        return {}
+
+    monkeypatch.setattr(routes, 'run_plan', run_plan)
+    client = app.test_client()
+    job_id = client.post('/start', json=PLAN).get_json()['job_id']
+    job = routes.plan_jobs.get(job_id)
+    while job.status == 'queued':
+        pass
+    assert get_job_counts(client)['running'] >= 1
+
+    release.set()
+    job.future.result(10)
+
+    counts = get_job_counts(client)
+    assert counts['running'] == 0
+    assert counts['done'] >= 1
+    assert set(counts) == {'queued', 'running', 'done', 'failed', 'cancelled'}
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from planner.core import fill_matrix, update_daily_production, update_hour
+from planner.plan import FACILITY_FIELDS, HOUR_FIELDS, TOTAL_FIELDS, NORTH, SOUTH
+
+FIELDS = FACILITY_FIELDS + HOUR_FIELDS + TOTAL_FIELDS
+# (day, hour, is_north) of the slots the moves change, the first slot twice
+CHANGES = ((0, 3, True), (0, 3, True), (40, 12, False), (200, 20, True), (364, 0, False))
+
+
+@pytest.fixture
+def matrix(reference_data):
+    matrix = fill_matrix(2021, reference_data)
+    update_daily_production(matrix, reference_data)
+    return matrix
+
+
+def apply_changes(matrix, reference_data):
+    for day, hour, is_north in CHANGES:
+        update_hour(matrix, reference_data, day, hour, is_north, np.inf)
+
+
+def assert_bit_identical(matrix, snapshot):
+    for field in FIELDS:
+        assert np.array_equal(getattr(matrix, field), snapshot[field]), field
+
+
+def test_rollback_is_bit_identical(matrix, reference_data):
+    snapshot = matrix.snapshot()
+
+    move = matrix.begin_move()
+    apply_changes(matrix, reference_data)
+    assert not np.array_equal(matrix.production_amount, snapshot['production_amount'])
+    move.rollback()
+
+    assert_bit_identical(matrix, snapshot)
+    assert matrix.move is None
+
+
+def test_move_block_rolls_back_unless_committed(matrix, reference_data):
+    snapshot = matrix.snapshot()
+    with matrix.begin_move():
+        apply_changes(matrix, reference_data)
+    assert_bit_identical(matrix, snapshot)
+
+    with matrix.begin_move() as move:
+        apply_changes(matrix, reference_data)
+        cost_delta = move.get_cost_delta()
+        production_delta = move.get_production_delta()
+        move.commit()
+
+    assert cost_delta == pytest.approx(matrix.price.sum() - snapshot['price'].sum())
+    assert production_delta == pytest.approx(matrix.production_amount.sum() - snapshot['production_amount'].sum())
+    assert matrix.number_of_pumps[0, 3, NORTH] == snapshot['number_of_pumps'][0, 3, NORTH] + 2
+    assert matrix.number_of_pumps[40, 12, SOUTH] == snapshot['number_of_pumps'][40, 12, SOUTH] + 1
+
+
+def test_restore_is_bit_identical(matrix, reference_data):
+    snapshot = matrix.snapshot()
+    apply_changes(matrix, reference_data)
+    matrix.restore(snapshot)
+
+    assert_bit_identical(matrix, snapshot)
+
+
+def test_a_single_move_is_open_at_a_time(matrix):
+    with matrix.begin_move():
+        with pytest.raises(RuntimeError):
+            matrix.begin_move()
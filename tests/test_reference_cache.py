@@ -0,0 +1,94 @@
+import json
+import os
+
+import mongomock
+import pytest
+
+from app.reference_cache import ReferenceDataCache, load_reference_data
+from planner.reference_data import COLLECTIONS
+
+from tests.conftest import DB_DIRECTORY
+
+TTL_SECONDS = 60
+
+
+@pytest.fixture
+def db():
+    """a mongomock database holding the reference documents of db/"""
+    db = mongomock.MongoClient().sorek
+    for collection in COLLECTIONS:
+        with open(os.path.join(DB_DIRECTORY, f'{collection}.json')) as collection_file:
+            document = json.load(collection_file)[0]
+        document.pop('_id', None)
+        db[collection].insert_one(document)
+
+    return db
+
+
+@pytest.fixture
+def cache(db) -> ReferenceDataCache:
+    return ReferenceDataCache(lambda: load_reference_data(db), TTL_SECONDS)
+
+
+def expire(cache: ReferenceDataCache) -> None:
+    cache.loaded_at -= TTL_SECONDS
+
+
+def test_get_is_answered_from_memory_within_the_ttl(cache):
+    reference_data = cache.get()
+
+    assert cache.get() is reference_data
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_an_expired_reload_with_the_same_version_keeps_the_reference_data(cache):
+    reference_data = cache.get()
+    expire(cache)
+
+    assert cache.get() is reference_data
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_an_expired_reload_picks_up_a_changed_document(cache, db):
+    reference_data = cache.get()
+    db.production_limits.update_one({}, {'$set': {'jul_aug.hourly.max': 20000}})
+    assert cache.get() is reference_data
+
+    expire(cache)
+    reloaded = cache.get()
+
+    assert reloaded.version != reference_data.version
+    assert reloaded.production_limits['jul_aug']['hourly']['max'] == 20000
+
+
+def test_invalidate_loads_again_on_the_next_get(cache, db):
+    reference_data = cache.get()
+    db.taoz_cost_limit.update_one({}, {'$set': {'taoz_cost.5.PISGA': 100}})
+
+    cache.invalidate()
+    reloaded = cache.get()
+
+    assert reloaded is not reference_data
+    assert reloaded.taoz_cost_table[5, 2] == 100
+    assert cache.misses == 2
+
+
+def test_a_missing_document_raises(cache, db):
+    db.holidays.delete_many({})
+
+    with pytest.raises(ValueError, match='holidays'):
+        cache.get()
+
+
+def test_a_document_with_a_missing_table_value_raises(cache, db):
+    db.specific_energy.update_one({}, {'$unset': {'north.0.e_3': ''}})
+
+    with pytest.raises(ValueError, match='reference tables'):
+        cache.get()
+
+
+def test_a_negative_table_value_raises(cache, db):
+    db.min_max_hp.update_one({}, {'$set': {'south.0.max': -1}})
+
+    with pytest.raises(ValueError, match='max_hp_table'):
+        cache.get()
@@ -0,0 +1,33 @@
+import numpy as np
+
+from planner import plan, replan
+from planner.core import get_changed_bio_months, fill_matrix
+from planner.reference_data import merge_documents
+
+TARGET = 151700000
+JUNE_TARIFF = {'taoz_cost_limit': {'taoz_cost': {'5': {'PISGA': 100}}}}
+
+
+def test_a_list_item_override_only_changes_that_item():
+    document = {'taoz_cost': [{'PISGA': 1, 'GEVA': 2}, {'PISGA': 3, 'GEVA': 4}]}
+
+    merged = merge_documents(document, {'taoz_cost': {'1': {'PISGA': 5}}})
+
+    assert merged == {'taoz_cost': [{'PISGA': 1, 'GEVA': 2}, {'PISGA': 5, 'GEVA': 4}]}
+    assert document['taoz_cost'][1]['PISGA'] == 3
+
+
+def test_a_june_tariff_change_only_touches_may_june(reference_data):
+    prior = fill_matrix(2021, reference_data)
+    reference_data_with_delta = reference_data.with_overrides(JUNE_TARIFF)
+    fresh = fill_matrix(2021, reference_data_with_delta)
+
+    assert get_changed_bio_months(prior, fresh, reference_data, reference_data_with_delta) == [2]
+
+
+def test_replan_keeps_the_shutdown_dates_of_the_prior_plan(reference_data):
+    prior = plan(2021, TARGET, reference_data)
+    matrix = replan(prior, reference_data, JUNE_TARIFF, TARGET)
+
+    assert not matrix.apply_shutdown_dates
+    assert np.array_equal(matrix.shutdown, prior.shutdown)
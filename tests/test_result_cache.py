@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.result_cache import PlanResultCache, get_plan_key
+
+REQUESTS = 4
+
+
+def get_result(tmp_path, name: str = 'plan.xlsx') -> dict:
+    path = tmp_path / name
+    path.write_text('')
+    return {'file': str(path)}
+
+
+def test_concurrent_identical_keys_compute_once(tmp_path):
+    cache = PlanResultCache(8)
+    key = get_plan_key({'year': 2021, 'target': 151700000}, 'version')
+    computing = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(threading.get_ident())
+        computing.set()
+        release.wait(5)
+        return get_result(tmp_path)
+
+    with ThreadPoolExecutor(REQUESTS) as executor:
+        futures = [executor.submit(cache.get_or_compute, key, compute)]
+        assert computing.wait(5)
+        futures += [executor.submit(cache.get_or_compute, key, compute) for _ in range(REQUESTS - 1)]
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert len(calls) == 1
+    assert [is_cached for _, is_cached in results] == [False] + [True] * (REQUESTS - 1)
+    assert all(result is results[0][0] for result, _ in results)
+
+
+def test_failed_compute_is_raised_once_and_retried(tmp_path):
+    cache = PlanResultCache(8)
+    key = get_plan_key({'year': 2021, 'target': 151700000}, 'version')
+    computing = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        computing.set()
+        release.wait(5)
+        raise ValueError('no plan')
+
+    with ThreadPoolExecutor(2) as executor:
+        failing = executor.submit(cache.get_or_compute, key, fail)
+        assert computing.wait(5)
+        waiting = executor.submit(cache.get_or_compute, key, lambda: get_result(tmp_path))
+        release.set()
+
+        with pytest.raises(ValueError):
+            failing.result(5)
+        result, is_cached = waiting.result(5)
+
+    assert not is_cached
+    assert cache.get_or_compute(key, fail) == (result, True)
+
+
+def test_least_recently_used_result_is_evicted(tmp_path):
+    cache = PlanResultCache(2)
+    keys = [get_plan_key({'year': 2021, 'target': target}, 'version') for target in (1, 2, 3)]
+    for index, key in enumerate(keys[:2]):
+        cache.get_or_compute(key, lambda: get_result(tmp_path, f'{index}.xlsx'))
+
+    cache.get_or_compute(keys[0], lambda: pytest.fail('cached'))
+    cache.get_or_compute(keys[2], lambda: get_result(tmp_path, '2.xlsx'))
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None